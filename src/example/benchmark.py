@@ -0,0 +1,284 @@
+"""
+Benchmarks of the simulator hot paths on synthetic data.
+
+Run from ``src`` with ``python -m example.benchmark``. Every case runs in a
+fresh process so its peak RSS is its own; the results are printed and
+saved as JSON, and ``--compare`` prints the change against a saved run.
+"""
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+import ib_async
+from ib_async.order import LimitOrder, MarketOrder
+
+from ibkr_sim.bar_store import SymbolBars
+from ibkr_sim.sim_clock import toDatetime
+from ibkr_sim.sim_ib import IBSim
+from ibkr_sim.synthetic import SyntheticBars
+from example import stats
+from example.contract_info import load_contract
+from example.stoch_k import stoch_k
+
+logger = logging.getLogger()
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+REPLAY_SIZES = (10_000, 1_000_000, 10_000_000)
+RESTING_ORDERS = (1, 100, 10_000)
+TRADE_COUNTS = (1_000, 100_000)
+
+
+def make_bars(n: int, seed: int = 0) -> SymbolBars:
+    """Synthetic 1 min ES bars, around the clock on weekdays, from 2021-01-04."""
+    return SyntheticBars.fromContract(es(), barSize=60, seed=seed).bars(n)
+
+
+def make_trades(n: int, seed: int = 0) -> pd.DataFrame:
+    """Trade results in the TradeJournal layout."""
+    rng = np.random.default_rng(seed)
+    entry = 4000 + rng.normal(0, 50, n)
+    return pd.DataFrame({
+        'ticker': 'ES',
+        'direction': np.where(rng.random(n) < 0.5, 'Long', 'Short'),
+        'qty': 1,
+        'entry_dt': '',
+        'entry_price': entry,
+        'exit_dt': '',
+        'exit_price': entry + rng.normal(0, 10, n),
+        'bars': rng.integers(1, 50, n),
+        'profit': rng.normal(20, 500, n)})
+
+
+def es():
+    return load_contract(os.path.join(DATA_DIR, 'contracts.toml'), 'ES')
+
+
+def contract_data(bars: SymbolBars) -> dict:
+    return {'ES': {'ContractDetails': es(), 'bars': bars}}
+
+
+def connect(ContractData: dict) -> IBSim:
+    ib = IBSim(ContractData=ContractData)
+    ib._logger.setLevel(logging.ERROR)
+    ib.wrapper._logger.setLevel(logging.ERROR)
+    ib.connect('127.0.0.1', 7497, clientId=1)
+    return ib
+
+
+def result(name: str, ops: int, seconds: float, bars: int = 0) -> dict:
+    return {
+        'name': name,
+        'ops': ops,
+        'seconds': seconds,
+        'us_per_op': seconds / ops * 1e6 if ops else 0.0,
+        'bars_per_sec': bars / seconds if bars and seconds else None,
+    }
+
+
+def bench_warmup(n: int = 100_000, repeat: int = 20) -> dict:
+    """reqHistoricalData of 30 days of 1 min bars, without replay."""
+    data = contract_data(make_bars(n))
+    ib = connect(data)
+    contract = data['ES']['ContractDetails'].contract
+    end = toDatetime(int(data['ES']['bars'].ts[-1]))
+    t = time.perf_counter()
+    bars = 0
+    for _ in range(repeat):
+        bars += len(ib.reqHistoricalData(contract, end, '30 D', '1 min', 'TRADES', False))
+    return result('warmup 30 D', repeat, time.perf_counter() - t, bars)
+
+
+def bench_replay(n: int) -> dict:
+    """keepUpToDate replay of n bars into a 5000 bar window with an empty handler."""
+    data = contract_data(make_bars(n))
+    ib = connect(data)
+    bars = ib.reqHistoricalData(data['ES']['ContractDetails'].contract, '', '1 D', '1 min', 'TRADES', False,
+                                keepUpToDate=True, maxBars=5000)
+    bars.updateEvent += lambda bars, hasNewBar: None
+    t = time.perf_counter()
+    ib.run()
+    seconds = time.perf_counter() - t
+    replayed = ib.client.barsReplayed
+    return result(f'replay {n} bars', replayed, seconds, replayed)
+
+
+def bench_matching(resting: int, n: int = 20_000) -> dict:
+    """update_executions per bar with resting LMT orders none of the bars reach."""
+    bars = make_bars(n)
+    data = contract_data(bars)
+    ib = connect(data)
+    contract = data['ES']['ContractDetails'].contract
+    low = float(bars.low.min())
+    for i in range(resting):
+        ib.placeOrder(contract, LimitOrder('BUY', 1, round(low - 10 - i * 0.25, 2)))
+    rows = list(zip(bars.open.tolist(), bars.high.tolist(), bars.low.tolist(), bars.close.tolist()))
+    update = ib.client.update_executions
+    t = time.perf_counter()
+    for o, h, l, c in rows:
+        update(contract, o, h, l, c)
+    return result(f'update_executions {resting} resting', n, time.perf_counter() - t)
+
+
+def bench_execution(n: int = 10_000) -> dict:
+    """do_execution of n market fills, alternating buys and sells."""
+    data = contract_data(make_bars(1000))
+    ib = connect(data)
+    contract = data['ES']['ContractDetails'].contract
+    trades = [ib.placeOrder(contract, MarketOrder('BUY' if i % 2 else 'SELL', 1)) for i in range(n)]
+    for trade in trades:
+        ib.client.orderBook.remove(trade)
+    execute = ib.client.do_execution
+    t = time.perf_counter()
+    for i, trade in enumerate(trades):
+        execute(trade, 4000.0 + i % 10)
+    return result('do_execution', n, time.perf_counter() - t)
+
+
+def bench_strategy(n: int = 50_000) -> dict:
+    """stoch_k.update per bar on a growing bar list."""
+    allBars = make_bars(n).barList(0, n)
+    strategy = stoch_k()
+    warmup = 4000
+    bars = allBars[:warmup]
+    strategy.update(0, bars, True)
+    t = time.perf_counter()
+    for bar in allBars[warmup:]:
+        bars.append(bar)
+        strategy.update(0, bars, True)
+    return result('stoch_k.update', n - warmup, time.perf_counter() - t)
+
+
+def bench_stats(trades: int, repeat: int = 20) -> list:
+    """Every stats metric on a frame of trades."""
+    frame = make_trades(trades)
+    results = []
+    for name, fn in inspect.getmembers(stats, inspect.isfunction):
+        if fn.__module__ != stats.__name__:
+            continue
+        params = inspect.signature(fn).parameters
+        kwargs = {'risk_free_rate': 3.0} if 'risk_free_rate' in params else {}
+        t = time.perf_counter()
+        for _ in range(repeat):
+            fn(frame, **kwargs)
+        results.append(result(f'stats.{name} {trades} trades', repeat, time.perf_counter() - t))
+    return results
+
+
+def bench_snapshot(n: int = 100_000, maxBars: int = 5000) -> list:
+    """
+    Snapshot of a keepUpToDate replay halfway into a ``maxBars`` window and
+    resume on a new IBSim; the resumed run has to end where the full one does.
+    """
+    data = contract_data(make_bars(n))
+    contract = data['ES']['ContractDetails'].contract
+    taken = []
+
+    def replay(ib, bars, snapAt=None):
+        def onBar(bars, hasNewBar):
+            i = bars[-1].barCount
+            if i % 100 == 0:
+                ib.placeOrder(contract, MarketOrder('BUY' if i % 200 else 'SELL', 1))
+            if i == snapAt:
+                t = time.perf_counter()
+                taken.append((ib.snapshot(), time.perf_counter() - t))
+        bars.updateEvent += onBar
+        ib.run()
+        return len(bars), bars[-1].barCount, ib.client.TotalCashBalance
+
+    ib = connect(data)
+    bars = ib.reqHistoricalData(contract, '', '1 D', '1 min', 'TRADES', False, keepUpToDate=True, maxBars=maxBars)
+    full = replay(ib, bars, snapAt=n // 2)
+    snapshot, seconds = taken[0]
+    ib = connect(data)
+    t = time.perf_counter()
+    ib.resume(snapshot)
+    resumed = time.perf_counter() - t
+    bars, = ib.wrapper.reqId2Subscriber.values()
+    if replay(ib, bars) != full:
+        raise RuntimeError('resumed replay differs from the full one')
+    return [result(f'snapshot {maxBars} bar window', 1, seconds),
+            result(f'resume {maxBars} bar window', 1, resumed)]
+
+
+def run_case(case: tuple) -> list:
+    """Run one case; the worker process is fresh, so ru_maxrss is the case's peak."""
+    fn, args = case
+    res = globals()[fn](*args)
+    res = res if isinstance(res, list) else [res]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for r in res:
+        r['peak_rss_mb'] = peak
+    return res
+
+
+def cases(replaySizes) -> list:
+    return ([('bench_warmup', ())]
+            + [('bench_replay', (n,)) for n in replaySizes]
+            + [('bench_matching', (n,)) for n in RESTING_ORDERS]
+            + [('bench_execution', ())]
+            + [('bench_strategy', ())]
+            + [('bench_snapshot', ())]
+            + [('bench_stats', (n,)) for n in TRADE_COUNTS])
+
+
+def run(replaySizes=REPLAY_SIZES, only: str = '') -> list:
+    results = []
+    for case in cases(replaySizes):
+        if only and only not in case[0]:
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            results.extend(pool.submit(run_case, case).result())
+    return results
+
+
+def metadata() -> dict:
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ib_async': ib_async.__version__,
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def compare(results: list, previous: dict) -> pd.DataFrame:
+    """µs/op of this run against a saved one; ratio above 1 is slower."""
+    old = {r['name']: r for r in previous['results']}
+    rows = [(r['name'], old[r['name']]['us_per_op'], r['us_per_op'], r['us_per_op'] / old[r['name']]['us_per_op'])
+            for r in results if r['name'] in old and old[r['name']]['us_per_op']]
+    return pd.DataFrame(rows, columns=['name', 'old_us_per_op', 'us_per_op', 'ratio']).set_index('name')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, REPLAY_SIZES)), help='replay sizes in bars')
+    parser.add_argument('--quick', action='store_true', help='replay 10k and 100k bars only')
+    parser.add_argument('--only', default='', help='run the cases whose function name contains this')
+    parser.add_argument('--output', default='benchmark.json', help='results file')
+    parser.add_argument('--compare', help='results file of an earlier run')
+    args = parser.parse_args()
+    sizes = (10_000, 100_000) if args.quick else tuple(int(n) for n in args.sizes.split(','))
+
+    results = run(sizes, args.only)
+    with open(args.output, 'w') as fp:
+        json.dump({'meta': metadata(), 'results': results}, fp, indent=1)
+    pd.set_option('display.width', 1000)
+    pd.set_option('display.max_columns', 10)
+    logger.info(pd.DataFrame(results).set_index('name').round(3))
+    if args.compare:
+        with open(args.compare) as fp:
+            logger.info(compare(results, json.load(fp)).round(3))
@@ -1,10 +1,11 @@
 import os
+import logging
 import tomllib
 import pandas as pd
 import sqlite3
 from functools import cache
 from dataclasses import dataclass, field
-from typing import List, NamedTuple, Optional, Dict
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Dict, Tuple
 
 from ib_async import Future, Contract, ContractDetails
 
@@ -55,29 +56,97 @@ def load_csv(csvfilename: str, symbol: str) -> pd.DataFrame:
         usecols=[0, 1, 2, 3, 4, 5, 6], 
         parse_dates=True
     )
-    df['date'] = pd.to_datetime(df["dt"] + " " + df["tm"], format="mixed")
+    stamps = df["dt"] + " " + df["tm"]
+    try:
+        # one format inferred from the first row parses vectorized
+        df['date'] = pd.to_datetime(stamps)
+    except (ValueError, TypeError):
+        df['date'] = pd.to_datetime(stamps, format="mixed")
     return df.drop(columns=["dt", "tm"])
 
+DB_TABLE = "tbl_5min_data"
+DB_INDEX = "idx_5min_data_ticker_datetime"
+DB_COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+
+
 def load_db(dbfilename: str, symbol: str, startDateStr: str = '', endDateStr: str = '') -> pd.DataFrame:
     """Load historical data from SQLite database with optional date filtering."""
     try:
-        query = _build_db_query(symbol, startDateStr, endDateStr)
+        query, params = _build_db_query(symbol, startDateStr, endDateStr)
         
         with sqlite3.connect(dbfilename) as conn:
-            return pd.read_sql_query(query, conn)
+            ensure_db_index(conn)
+            return pd.read_sql_query(query, conn, params=params)
             
     except KeyError:
         raise ValueError(f"Contract {symbol} not found in contracts.toml")
 
-def _build_db_query(symbol: str, startDateStr: str, endDateStr: str) -> str:
-    """Build SQL query with date filters."""
-    query = f"SELECT datetime as date, open, high, low, close, volume FROM tbl_5min_data where ticker='{symbol}'"
+def iter_db(dbfilename: str, symbol: str, startDateStr: str = '', endDateStr: str = '', chunksize: int = 50_000) -> Iterator[pd.DataFrame]:
+    """
+    Stream historical data from SQLite database in frames of at most ``chunksize`` bars,
+    fetched with ``fetchmany`` so only one chunk is held in memory at a time.
+    """
+    query, params = _build_db_query(symbol, startDateStr, endDateStr)
+    conn = sqlite3.connect(dbfilename)
+    try:
+        ensure_db_index(conn)
+        cursor = conn.execute(query, params)
+        while rows := cursor.fetchmany(chunksize):
+            yield pd.DataFrame.from_records(rows, columns=DB_COLUMNS)
+    finally:
+        conn.close()
+
+def write_db(dbfilename: str, symbol: str, frames: Iterable[pd.DataFrame]) -> int:
+    """
+    Append bars to the database table ``load_db`` reads, e.g. the ``frames`` of a
+    ``SyntheticBars``, creating the table if needed. One frame is converted at a time.
+    Returns the number of bars written.
+    """
+    count = 0
+    with sqlite3.connect(dbfilename) as conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {DB_TABLE} "
+                     "(ticker TEXT, datetime TEXT, open REAL, high REAL, low REAL, close REAL, volume REAL)")
+        for df in frames:
+            dates = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+            conn.executemany(f"INSERT INTO {DB_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             zip([symbol] * len(df), dates.tolist(), *(df[c].tolist() for c in DB_COLUMNS[1:])))
+            count += len(df)
+        ensure_db_index(conn)
+    return count
+
+def ensure_db_index(conn: sqlite3.Connection) -> bool:
+    """
+    Make sure the bar table has an index leading with (ticker, datetime), so a
+    symbol and date range is an index range scan instead of a table scan.
+    A missing index is created covering the bar columns; read-only databases
+    are left as they are. Returns True when such an index exists.
+    """
+    for _, name, *_ in conn.execute(f"PRAGMA index_list({DB_TABLE})").fetchall():
+        columns = [row[2] for row in conn.execute(f"PRAGMA index_info({name})").fetchall()]
+        if columns[:2] == ["ticker", "datetime"]:
+            return True
+    try:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {DB_INDEX} ON {DB_TABLE} "
+                     "(ticker, datetime, open, high, low, close, volume)")
+        conn.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        logging.warning(f"{DB_TABLE}: could not create index {DB_INDEX}: {e}")
+        return False
+
+def _build_db_query(symbol: str, startDateStr: str, endDateStr: str) -> Tuple[str, tuple]:
+    """Build SQL query with date filters as bound parameters."""
+    query = f"SELECT datetime as date, open, high, low, close, volume FROM {DB_TABLE} where ticker=?"
+    params = [symbol]
     
     if startDateStr and endDateStr:
-        query += f" and datetime between '{startDateStr}' and '{endDateStr}'"
+        query += " and datetime between ? and ?"
+        params += [startDateStr, endDateStr]
     elif startDateStr:
-        query += f" and datetime >= '{startDateStr}'"
+        query += " and datetime >= ?"
+        params += [startDateStr]
     elif endDateStr:
-        query += f" and datetime <= '{endDateStr}'"
+        query += " and datetime <= ?"
+        params += [endDateStr]
     
-    return query
+    return query + " order by datetime", tuple(params)
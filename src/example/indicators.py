@@ -0,0 +1,129 @@
+"""
+Incremental indicators: each update takes the newest value and costs O(1),
+independent of how much history the strategy keeps; :class:`SMA` costs
+O(length), see there.
+
+Values are NaN until the window is full, like the pandas ``rolling`` and
+pandas_ta versions they replace. :func:`stochK` computes a whole series at
+once, for callers that cache it across runs.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+nan = math.nan
+
+
+class RollingMax:
+    """HHV over the last ``length`` values using a monotonic deque."""
+
+    def __init__(self, length: int):
+        self.length = length
+        self._count = 0
+        self._window = deque()  # (index, value), values decreasing
+
+    def _dominates(self, old: float, new: float) -> bool:
+        return old <= new
+
+    def update(self, x: float) -> float:
+        window = self._window
+        while window and self._dominates(window[-1][1], x):
+            window.pop()
+        window.append((self._count, x))
+        self._count += 1
+        if window[0][0] <= self._count - 1 - self.length:
+            window.popleft()
+        return self.value
+
+    @property
+    def value(self) -> float:
+        """Extreme of the values seen so far in the window, NaN until ``length`` values were seen."""
+        return self._window[0][1] if self._count >= self.length else nan
+
+
+class RollingMin(RollingMax):
+    """LLV over the last ``length`` values using a monotonic deque."""
+
+    def _dominates(self, old: float, new: float) -> bool:
+        return old >= new
+
+
+class SMA:
+    """
+    Simple moving average, NaN inputs before the first value are skipped.
+
+    Each update sums the whole window, O(length), on purpose: the terms are
+    weighted and added like pandas_ta's convolution so the values are bit for
+    bit those of the pandas version and of :func:`stochK`. A running sum
+    rounds differently and flips signals sitting exactly on a threshold.
+    ``smooth_k`` windows are a few bars, so this stays cheap.
+    """
+
+    def __init__(self, length: int):
+        self.length = length
+        self._weight = 1.0 / length
+        self._window = deque(maxlen=length)
+        self.value = nan
+
+    def update(self, x: float) -> float:
+        if math.isnan(x) and not self._window:
+            return nan
+        self._window.append(x)
+        if len(self._window) == self.length:
+            w = self._weight
+            self.value = sum(v * w for v in self._window)
+        return self.value
+
+
+class StochK:
+    """
+    Slow %K, same as ``ta.stoch(high, low, close, k, smooth_k=smooth_k)`` STOCHk.
+    ``previous`` holds the value of the bar before, i.e. ``.iloc[-2]``.
+    """
+
+    def __init__(self, k: int, smooth_k: int = 3):
+        self._hh = RollingMax(k)
+        self._ll = RollingMin(k)
+        self._smooth = SMA(smooth_k) if smooth_k > 1 else None
+        self.value = nan
+        self.previous = nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        hh = self._hh.update(high)
+        ll = self._ll.update(low)
+        # pandas_ta adds epsilon to a zero range rather than dividing by zero
+        stoch = 100 * (close - ll) / ((hh - ll) or 2.220446049250313e-16)
+        self.previous = self.value
+        self.value = self._smooth.update(stoch) if self._smooth else stoch
+        return self.value
+
+
+def stochK(bars, k: int, smooth_k: int = 3) -> np.ndarray:
+    """
+    StochK of every bar of ``bars`` (anything with high, low and close arrays)
+    in one vectorized pass. The operations are those of :class:`StochK` in
+    the same order, so each value equals feeding the bars one by one.
+    """
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (bars.high, bars.low, bars.close))
+    out = np.full(len(close), nan)
+    if len(close) < k:
+        return out
+    hh = sliding_window_view(high, k).max(axis=1)
+    ll = sliding_window_view(low, k).min(axis=1)
+    span = hh - ll
+    stoch = 100 * (close[k - 1:] - ll) / np.where(span == 0, 2.220446049250313e-16, span)
+    if smooth_k <= 1:
+        out[k - 1:] = stoch
+        return out
+    m = len(stoch) - smooth_k + 1
+    if m <= 0:
+        return out
+    w = 1.0 / smooth_k
+    smooth = stoch[:m] * w
+    for j in range(1, smooth_k):
+        smooth = smooth + stoch[j:j + m] * w
+    out[k + smooth_k - 2:] = smooth
+    return out
@@ -0,0 +1,24 @@
+import logging
+
+import pandas as pd
+
+from ibkr_sim.optimizer import Optimize, Optimizer
+from example.sim import Trader, load_data
+
+logger = logging.getLogger()
+
+
+def backtest(ContractData, **params):
+    trader = Trader(ContractData=ContractData, **params)
+    trader.backtest()
+    return trader.metrics()
+
+
+if __name__ == "__main__":
+    # sm = Optimize("smooth",1,1,5,1); nbars = Optimize("NBars",4,1,10,1);
+    params = {**Optimize('smooth_k', 1, 1, 5, 1), **Optimize('trail_lookback', 4, 1, 10, 1)}
+    results = Optimizer(load_data(), backtest).run(params)
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.width', 1000)
+    logger.info(results.sort_values('NetProfit', ascending=False))
@@ -4,10 +4,14 @@ import pandas as pd
 from pandas import DataFrame
 from datetime import datetime
 from dataclasses import dataclass, field
+from functools import partial
 from ib_async import IB, util, Position, Trade, Fill, CommissionReport
 from ib_async.order import LimitOrder, Order, OrderStatus, StopOrder, MarketOrder
 
+from ibkr_sim.bar_cache import BarCache
 from ibkr_sim.sim_ib import IBSim
+from ibkr_sim.snapshot import Snapshot
+from ibkr_sim.trade_journal import TradeJournal
 from example import stats
 from example.contract_info import load_db, load_contract
 from example.stoch_k import stoch_k, Signals
@@ -23,40 +27,53 @@ logger.addHandler(handler)
 
 
 # util.logToConsole(logger.ERROR)
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), r'example/data')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# replay starts here, the 30 days before it are the strategy warmup
+BACKTEST_START = "20211214 00:00:00"
+
+def load_data(symbol='ES', startDateStr="2021-11-14", endDateStr="2021-12-16", cache=True):
+    """ContractData for IBSim from the example contracts file and database, through the bar cache."""
+    contractDetails = load_contract(filename=os.path.join(DATA_DIR,"contracts.toml"), symbol=symbol)
+    dbfilename = os.path.join(DATA_DIR,"trading_data.sqlite")
+    loader = partial(load_db, dbfilename=dbfilename, symbol=contractDetails.contract.symbol, startDateStr=startDateStr, endDateStr=endDateStr)
+    if not cache:
+        return {contractDetails.contract.symbol:{'ContractDetails':contractDetails, 'df':loader()}}
+    bars = BarCache(os.path.join(DATA_DIR, "cache")).load(dbfilename, contractDetails.contract.symbol, loader, startDateStr, endDateStr)
+    return {contractDetails.contract.symbol:{'ContractDetails':contractDetails, 'bars':bars}}
 
 class Trader():
 
-    def __init__(self, AccountBalance=100_000.0):
+    def __init__(self, AccountBalance=100_000.0, ContractData=None, indicators=None, **strategyParams):
 
-        self.contractDetails = load_contract(filename=os.path.join(DATA_DIR,"contracts.toml"), symbol='ES')
-        df = load_db(dbfilename=os.path.join(DATA_DIR,"trading_data.sqlite"), symbol=self.contractDetails.contract.symbol, startDateStr="2021-12-14", endDateStr="2021-12-16")
-        contract = {self.contractDetails.contract.symbol:{'ContractDetails':self.contractDetails, 'df':df}}
+        if ContractData is None:
+            ContractData = load_data()
+        self.contractDetails = ContractData['ES']['ContractDetails']
+        self.AccountBalance = AccountBalance
 
-        self.ib = IBSim(ContractData=contract, AccountBalance=AccountBalance)
+        self.ib = IBSim(ContractData=ContractData, AccountBalance=AccountBalance)
         self.ib._logger.setLevel(logging.ERROR)
         self.ib.wrapper._logger.setLevel(logging.ERROR)
         self.ib.connect('127.0.0.1', 7497, clientId=1)
 
         self.ib.qualifyContracts(self.contractDetails.contract)
-        self.ib.commissionReportEvent += self.on_execution
 
-        self.strategy = stoch_k()  
+        self.strategy = stoch_k(**strategyParams)
+        if indicators is not None:
+            # walk-forward runs share the indicator series through the cache
+            symbol = self.contractDetails.contract.symbol
+            self.strategy.useIndicators(indicators, symbol, ContractData[symbol]['bars'])
         self.in_trade = 0
-        self.trade_bars = 0
-        self.trade_results = pd.DataFrame({
-                                    'ticker': pd.Series(dtype=str),
-                                    'direction': pd.Series(dtype=str),
-                                    'qty': pd.Series(dtype=int),
-                                    'entry_dt': pd.Series(dtype=str),
-                                    'entry_price': pd.Series(dtype=float),
-                                    'exit_dt': pd.Series(dtype=str),
-                                    'exit_price': pd.Series(dtype=float),
-                                    'bars': pd.Series(dtype=int),
-                                    'profit': pd.Series(dtype=float),
-                                })
+        self.journal = TradeJournal()
+        self.journal.closedEvent += self.on_trade_closed
         # Stats Parameters
         self.risk_free_rate = 5.0  # Set the risk-free rate (optional)
+        self.stats = stats.StatsAccumulator(self.risk_free_rate)  # metrics of the closed trades, live
+        self.ib.commissionReportEvent += self.on_execution
+        # save a snapshot to checkpointPath every checkpointEvery bars
+        self.checkpointPath = None
+        self.checkpointEvery = 10_000
+        self._bars = 0
         # self.orderList = [ MarketOrder('BUY', 1),  MarketOrder('SELL', 1), # Close Long
         #                    MarketOrder('SELL', 1), MarketOrder('BUY', 1), # Close Short
         #                    MarketOrder('BUY', 1),  MarketOrder('BUY', 1), MarketOrder('SELL', 2), # Add to position then Close
@@ -67,70 +84,17 @@ class Trader():
         #              ]
         # self.count = 0
 
+    @property
+    def trade_results(self) -> DataFrame:
+        return self.journal.to_frame()
+
     def on_execution(self, trade: Trade, fill: Fill, report: CommissionReport):
-        def open_position(ticker, side, qty, price, dt, commission):
-            direction = 'Long' if side == 1 else 'Short'
-            df = pd.DataFrame([{
-                'ticker': ticker,
-                'direction': direction,
-                'qty': qty,
-                'entry_dt': dt,
-                'entry_price': price,
-                'exit_dt': "",
-                'exit_price': 0,
-                'bars': 0,
-                'profit': -commission,
-            }])
-            self.trade_results = pd.concat([ self.trade_results, df], ignore_index=True)
-            self.in_trade = qty
-            self.trade_bars = 0
-        
-        def close_position(current_position, price, dt, commission, multiplier):
-            self.trade_results.loc[current_position.index, 'exit_dt'] = dt
-            self.trade_results.loc[current_position.index, 'exit_price'] = price
-            self.trade_results.loc[current_position.index, 'profit'] -= commission
-            if self.trade_results.loc[current_position.index, 'qty'].item() < 0:
-                self.trade_results.loc[current_position.index, 'profit'] += (self.trade_results.loc[current_position.index, 'entry_price']  - price)*multiplier
-            else:
-                self.trade_results.loc[current_position.index, 'profit'] += (price - self.trade_results.loc[current_position.index, 'entry_price'])*multiplier
-            self.trade_results.loc[current_position.index, 'bars'] = self.trade_bars
-                        
-
-        def add_position(current_position, qty, price, commission):
-            newAvgEntryPrice = (qty * price + self.trade_results.loc[current_position.index, 'qty']*self.trade_results.loc[current_position.index, 'entry_price']) / (qty + self.trade_results.loc[current_position.index, 'qty'])
-            self.trade_results.loc[current_position.index, 'entry_price'] = newAvgEntryPrice
-            self.trade_results.loc[current_position.index, 'qty'] += qty
-            self.trade_results.loc[current_position.index, 'profit'] -= commission
-
-
-        side = -1 if fill.execution.side == "SLD" else 1
-        current_position = self.trade_results[(self.trade_results['ticker'] == fill.contract.symbol) & (self.trade_results['exit_dt'] == "") & (self.trade_results['exit_price'] == 0)]
-        new_position_size = fill.execution.cumQty
-        if current_position.empty:
-            open_position(fill.contract.symbol, side, fill.execution.cumQty, fill.execution.avgPrice, fill.execution.time, report.commission)
-        else:
-            if new_position_size == -current_position.iloc[-1]['qty']:
-                # New position would close existing trade
-                close_position(current_position, fill.execution.avgPrice, fill.execution.time, report.commission, self.contractDetails.contract.multiplier)
-                self.in_trade = 0
-            # Add to existing position
-            elif new_position_size  + current_position.iloc[-1]['qty'] > 0 and new_position_size * current_position.iloc[-1]['qty'] > 0: 
-                add_position(current_position, fill.execution.cumQty, fill.execution.avgPrice, report.commission)
-            # Reducing to existing position
-            elif abs(new_position_size) < abs(current_position.iloc[-1]['qty']) and new_position_size * current_position.iloc[-1]['qty'] < 0:
-                comm_per_contract = report.commission / abs(fill.execution.cumQty)
-                new_position = current_position.iloc[0].to_dict()
-                new_position['qty'] = new_position_size + current_position.iloc[-1]['qty']
-                self.trade_results.loc[current_position.index, 'qty'] = fill.execution.cumQty + current_position.iloc[-1]['qty']
-                close_position(current_position, fill.execution.avgPrice, fill.execution.time, abs(fill.execution.cumQty + current_position.iloc[-1]['qty']) * comm_per_contract, self.contractDetails.contract.multiplier) 
-                open_position(fill.contract.symbol, -side, new_position['qty'], new_position['entry_price'], new_position['entry_dt'], abs(new_position['qty'])*comm_per_contract)
-            # Reverse existing position
-            elif abs(new_position_size) > abs(current_position.iloc[-1]['qty']) and new_position_size * current_position.iloc[-1]['qty'] < 0:
-                comm_per_contract = report.commission / abs(fill.execution.cumQty)
-                newQty = fill.execution.cumQty + current_position.iloc[-1]['qty']
-                close_position(current_position, fill.execution.avgPrice, fill.execution.time, abs(current_position.iloc[-1]['qty']) * comm_per_contract, self.contractDetails.contract.multiplier) 
-                open_position(fill.contract.symbol, side, newQty, fill.execution.avgPrice, fill.execution.time, abs(newQty) * comm_per_contract)
-        pass
+        self.journal.on_commission_report(trade, fill, report)
+        row = self.journal.openRow(fill.contract.conId)
+        self.in_trade = self.journal.column('qty')[row] if row >= 0 else 0
+
+    def on_trade_closed(self, row):
+        self.stats.add(self.journal.column('profit')[row], self.journal.column('entry_price')[row])
 
 
     def check_strategy(self, bars):
@@ -164,8 +128,7 @@ class Trader():
         
 
 
-        if abs(self.in_trade) > 0:
-            self.trade_bars += 1
+        self.journal.newBar()
         
             
         pass
@@ -173,11 +136,40 @@ class Trader():
     def on_bar_update(self, bars, hasNewBar):
         self.update_stats(bars)
         self.check_strategy(bars)    
+        self._bars += 1
+        if self.checkpointPath and self._bars % self.checkpointEvery == 0:
+            self.snapshot().save(self.checkpointPath)
+
+    def snapshot(self) -> Snapshot:
+        """Simulator and strategy state after the current bar."""
+        return self.ib.snapshot(state=(self.strategy, self.journal, self.stats, self.in_trade))
+
+    def resume(self, snapshot: Snapshot, **strategyParams):
+        """
+        Continue a backtest from ``snapshot`` instead of starting it with backtest().
+        With ``strategyParams`` a new strategy takes over from the snapshot's,
+        warming up on the bars so far and keeping its trailing stop.
+        """
+        strategy, self.journal, self.stats, self.in_trade = self.ib.resume(snapshot)
+        if strategyParams:
+            self.strategy = stoch_k(**strategyParams)
+            self.strategy.trail = strategy.trail
+        else:
+            self.strategy = strategy
+        self.journal.closedEvent += self.on_trade_closed
+        for bars in self.ib.realtimeBars():
+            bars.updateEvent += self.on_bar_update
+        self.ib.run()
 
-    def run(self):
+    def backtest(self, start=BACKTEST_START):
+        # util.allowCtrlC()
+        self.ib.run(self.backtestAsync(start))
+
+    async def backtestAsync(self, start=BACKTEST_START):
+        """The backtest as a coroutine, so several Traders can run it concurrently on one loop."""
         # session_type = SessionType.LIVE
-        bars = self.ib.reqHistoricalData(self.contractDetails.contract, 
-                                    endDateTime='', 
+        bars = await self.ib.reqHistoricalDataAsync(self.contractDetails.contract, 
+                                    endDateTime=start, 
                                     durationStr='30 D', 
                                     barSizeSetting='5 mins', 
                                     whatToShow='TRADES', 
@@ -187,9 +179,32 @@ class Trader():
                                     chartOptions=[]
                                 )
         bars.updateEvent += self.on_bar_update
+        await self.ib.runAsync()
+
+    def metrics(self) -> dict:
+        """Summary statistics of the finished backtest."""
+        results = {
+            'Trades': len(self.trade_results),
+            'NetProfit': self.ib.client.TotalCashBalance - self.AccountBalance,
+        }
+        if self.trade_results.empty:
+            return results
+        trades = self.trade_results
+        results.update({
+            'TotalProfit': stats.TotalProfit(trades),
+            'AvgProfitLoss': stats.AvgProfitLoss(trades),
+            'WinRatio': stats.WinRatio(trades),
+            'MaxSystemDrawdown': stats.MaxSystemDrawdown(trades),
+            'SharpeRatio': stats.SharpeRatio(trades, self.risk_free_rate),
+            'SortinoRatio': stats.SortinoRatio(trades, self.risk_free_rate),
+            'UlcerIndex': stats.UlcerIndex(trades),
+            'ProfitFactor': stats.ProfitFactor(trades),
+            'Expectancy': stats.Expectancy(trades),
+        })
+        return results
 
-        # util.allowCtrlC()
-        self.ib.run()
+    def run(self):
+        self.backtest()
         pd.set_option('display.max_columns', None)  # Show all columns
         pd.set_option('display.max_rows', None)     # Show all rows
         pd.set_option('display.width', 1000)        # Set width of display to avoid line wrapping
@@ -214,9 +229,8 @@ class Trader():
         #             running = False
         #             pygame.quit()
 
-broker = Trader()
-
 if __name__ == "__main__":
+    broker = Trader()
     try:
         broker.run()
         logger.info("==== Done ====")
@@ -1,20 +1,19 @@
+import math
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
 def calculate_returns(trade_results: DataFrame, risk_free_rate=3.0):
-    """Common calculations used across multiple metrics"""
-    trade_results['returns'] = trade_results['profit'] / trade_results['entry_price']
+    """Common calculations used across multiple metrics, returned on a new frame"""
+    returns = trade_results['profit'] / trade_results['entry_price']
     daily_risk_free_rate = (1 + risk_free_rate)**(1/252) - 1
-    trade_results['excess_return'] = trade_results['returns'] - daily_risk_free_rate
-    return trade_results
+    return trade_results.assign(returns=returns, excess_return=returns - daily_risk_free_rate)
 
 def calculate_drawdown(trade_results: DataFrame):
-    """Common drawdown calculations"""
-    trade_results['cumprofit'] = trade_results['profit'].cumsum()
-    trade_results['running_max'] = trade_results['cumprofit'].cummax()
-    trade_results['drawdown'] = trade_results['running_max'] - trade_results['cumprofit']
-    return trade_results
+    """Common drawdown calculations, returned on a new frame"""
+    cumprofit = trade_results['profit'].cumsum()
+    running_max = cumprofit.cummax()
+    return trade_results.assign(cumprofit=cumprofit, running_max=running_max, drawdown=running_max - cumprofit)
 
 def separate_trades(trade_results: DataFrame):
     """Split trades into winning and losing"""
@@ -23,8 +22,7 @@ def separate_trades(trade_results: DataFrame):
     return winning_trades, losing_trades
 
 def TotalProfit(trade_results:DataFrame):
-    total_profit = trade_results['profit'].cumsum() if not trade_results.empty else 0
-    return total_profit.iloc[-1]
+    return trade_results['profit'].sum()
 
 def AvgProfitLoss(trade_results:DataFrame):
     avg_profit_loss = trade_results['profit'].mean()
@@ -32,14 +30,12 @@ def AvgProfitLoss(trade_results:DataFrame):
         
 def AvgProfitLossPercent(trade_results:DataFrame):
     # Calculate profit percentage for each trade
-    trade_results['profit_percent'] = (trade_results['profit'] / trade_results['entry_price']) * 100
+    profit_percent = (trade_results['profit'] / trade_results['entry_price']) * 100
     # Calculate the average profit/loss percentage
-    avg_profit_loss_percent = trade_results['profit_percent'].mean()
-    return avg_profit_loss_percent.iloc[-1]
+    return profit_percent.mean()
 
 def AvgBarsHeld(trade_results:DataFrame):
-    avg_bars_held = trade_results['bars'].mean()
-    return avg_bars_held.iloc[-1]
+    return trade_results['bars'].mean()
 
 def WinRatio(trade_results:DataFrame):
     # Total number of trades
@@ -70,8 +66,7 @@ def MaxSystemDrawdown(trade_results: DataFrame):
 
 def UlcerIndex(trade_results: DataFrame):
     trade_results = calculate_drawdown(trade_results)
-    trade_results['drawdown_squared'] = trade_results['drawdown']**2
-    return np.sqrt(trade_results['drawdown_squared'].mean())
+    return np.sqrt((trade_results['drawdown']**2).mean())
 
 def ProfitFactor(trade_results: DataFrame):
     winning_trades, losing_trades = separate_trades(trade_results)
@@ -87,4 +82,102 @@ def Expectancy(trade_results: pd.DataFrame):
     average_win = winning_trades['profit'].mean() if len(winning_trades) > 0 else 0
     average_loss = abs(losing_trades['profit'].mean()) if len(losing_trades) > 0 else 0
     expectancy = (win_rate * average_win) - (loss_rate * average_loss)
-    return expectancy
\ No newline at end of file
+    return expectancy
+
+
+class StatsAccumulator:
+    """
+    Running version of the metrics above, updated with :meth:`add` as each
+    trade closes, so any metric can be read at any bar in O(1) without
+    touching a trade table. Mean and variance of the returns use Welford's
+    method; drawdown, downside deviation and the win/loss split are running
+    sums. Values agree with the DataFrame functions over the same trades.
+    """
+
+    def __init__(self, risk_free_rate=3.0):
+        self.daily_risk_free_rate = (1 + risk_free_rate)**(1/252) - 1
+        self.trades = 0
+        self.total_profit = 0.0
+        # Welford mean / variance of the trade returns
+        self._mean = 0.0
+        self._m2 = 0.0
+        # downside excess returns
+        self._downside_count = 0
+        self._downside_sq = 0.0
+        # drawdown of the cumulative profit
+        self._running_max = -math.inf
+        self.max_drawdown = 0.0
+        self._drawdown_sq = 0.0
+        # winners and losers
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+
+    def add(self, profit: float, entry_price: float):
+        """Account one closed trade."""
+        self.trades += 1
+        self.total_profit += profit
+
+        ret = profit / entry_price
+        delta = ret - self._mean
+        self._mean += delta / self.trades
+        self._m2 += delta * (ret - self._mean)
+
+        excess = ret - self.daily_risk_free_rate
+        if excess < 0:
+            self._downside_count += 1
+            self._downside_sq += excess * excess
+
+        self._running_max = max(self._running_max, self.total_profit)
+        drawdown = self._running_max - self.total_profit
+        self.max_drawdown = max(self.max_drawdown, drawdown)
+        self._drawdown_sq += drawdown * drawdown
+
+        if profit > 0:
+            self.wins += 1
+            self.gross_profit += profit
+        elif profit < 0:
+            self.losses += 1
+            self.gross_loss += profit
+
+    def TotalProfit(self):
+        return self.total_profit
+
+    def AvgProfitLoss(self):
+        return self.total_profit / self.trades if self.trades else np.nan
+
+    def WinRatio(self):
+        return self.wins / self.trades * 100 if self.trades else 0
+
+    def SharpeRatio(self):
+        if not self.trades:
+            return np.nan
+        mean_excess_return = self._mean - self.daily_risk_free_rate
+        std_dev_returns = math.sqrt(self._m2 / (self.trades - 1)) if self.trades > 1 else np.nan
+        return mean_excess_return / std_dev_returns if std_dev_returns != 0 else np.nan
+
+    def SortinoRatio(self):
+        if not self.trades or not self._downside_count:
+            return np.nan
+        downside_deviation = math.sqrt(self._downside_sq / self._downside_count)
+        mean_excess_return = self._mean - self.daily_risk_free_rate
+        return mean_excess_return / downside_deviation if downside_deviation != 0 else np.nan
+
+    def MaxSystemDrawdown(self):
+        return self.max_drawdown if self.trades else np.nan
+
+    def UlcerIndex(self):
+        return math.sqrt(self._drawdown_sq / self.trades) if self.trades else np.nan
+
+    def ProfitFactor(self):
+        return self.gross_profit / abs(self.gross_loss) if self.gross_loss != 0 else np.nan
+
+    def Expectancy(self):
+        if not self.trades:
+            return 0
+        win_rate = self.wins / self.trades
+        loss_rate = 1 - win_rate
+        average_win = self.gross_profit / self.wins if self.wins else 0
+        average_loss = abs(self.gross_loss / self.losses) if self.losses else 0
+        return (win_rate * average_win) - (loss_rate * average_loss)
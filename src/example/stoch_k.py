@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from ib_async import util
 from ib_async.objects import BarDataList, BarData
-import pandas_ta as ta
+
+from example.indicators import RollingMax, RollingMin, StochK, stochK
 
 import logging
 
@@ -44,59 +44,111 @@ class stoch_k():
         
     _signal = Signals.NONE
     
-    def __init__(self):
-        self.short = 7
-        self.medium = 40
-        self.smooth_k = 2
+    def __init__(self, short=7, medium=40, smooth_k=2, trail_lookback=4):
+        self.short = short
+        self.medium = medium
+        self.smooth_k = smooth_k
         self.trail = 0
-        self.trail_lookback = 4
+        self.trail_lookback = trail_lookback
         self.lookback = -100 * self.medium 
         self.count = 0
         self._signal = Signals.NONE
+        self._lastDate = None
+        self.s1 = StochK(self.short, self.smooth_k)
+        self.s2 = StochK(self.medium, self.smooth_k)
+        # windows over the last trail_lookback bars
+        self.closeMax = RollingMax(self.trail_lookback)
+        self.closeMin = RollingMin(self.trail_lookback)
+        self.lowMin = RollingMin(self.trail_lookback)
+        self.highMax = RollingMax(self.trail_lookback)
+        self.highMin = RollingMin(self.trail_lookback)
+        # precomputed (s1, s2) values by bar index, see useIndicators
+        self.series = None
 
 
     @property
     def signal(self):
         return self._signal
     
-
+    def useIndicators(self, indicators, symbol, bars):
+        """
+        Take the StochK values from an IndicatorCache instead of updating them
+        bar by bar. ``bars`` are the SymbolBars replayed at their own bar size,
+        so a bar's ``barCount`` indexes the series.
+        """
+        self.series = tuple(indicators.get(symbol, bars, stochK, k, self.smooth_k).tolist()
+                            for k in (self.short, self.medium))
+
+    def _newBars(self, bars):
+        """Bars not seen by the indicators yet, the first call seeds them from the lookback window."""
+        if self._lastDate is None:
+            return bars[self.lookback:]
+        i = len(bars)
+        while i > 0 and bars[i - 1].date > self._lastDate:
+            i -= 1
+        return bars[i:]
+
+    def _updateIndicators(self, bar: BarData):
+        """Feed one bar. Returns the windows of the bars before it, i.e. ``shift(1).rolling()``."""
+        prior = (self.closeMax.value, self.closeMin.value, self.lowMin.value, self.highMin.value)
+        if self.series is None:
+            self.s1.update(bar.high, bar.low, bar.close)
+            self.s2.update(bar.high, bar.low, bar.close)
+        else:
+            i = bar.barCount
+            for s, values in zip((self.s1, self.s2), self.series):
+                s.previous, s.value = s.value, values[i]
+        self.closeMax.update(bar.close)
+        self.closeMin.update(bar.close)
+        self.lowMin.update(bar.low)
+        self.highMax.update(bar.high)
+        self.highMin.update(bar.high)
+        self._lastDate = bar.date
+        return prior
 
     def update(self, inTrade, bars, hasNewBar):
-        df = util.df(bars[self.lookback:])
-        s1 = ta.stoch(df.high, df.low, df.close, k=self.short,   smooth_k=self.smooth_k)
-        s2 = ta.stoch(df.high, df.low, df.close, k=self.medium, smooth_k=self.smooth_k)
+        newBars = self._newBars(bars)
+        if not newBars:
+            # bar already evaluated, don't repeat its signal
+            self._signal = Signals.NONE
+            return
+        for bar in newBars:
+            prevCloseMax, prevCloseMin, prevLowMin, prevHighMin = self._updateIndicators(bar)
+        bar = newBars[-1]
+
         # Calc Trailing Stop
-        new_close_high = df['close'] > df['close'].shift(1).rolling(window=self.trail_lookback).max()
-        new_close_low  = df['close'] < df['close'].shift(1).rolling(window=self.trail_lookback).min()
-        if inTrade > 0 and new_close_high.iloc[-1]: # long
-            self.trail = max(self.trail, df['low'].shift(1).rolling(window=self.trail_lookback).min().iloc[-1])
+        new_close_high = bar.close > prevCloseMax
+        new_close_low  = bar.close < prevCloseMin
+        if inTrade > 0 and new_close_high: # long
+            self.trail = max(self.trail, prevLowMin)
 
-        elif inTrade < 0 and new_close_low.iloc[-1]: # short
-            self.trail = min(self.trail, df['high'].shift(1).rolling(window=self.trail_lookback).min().iloc[-1])
+        elif inTrade < 0 and new_close_low: # short
+            # FIXME: the docstring has STrail = HHV(Ref(High,-1),nbars)
+            self.trail = min(self.trail, prevHighMin)
 
 
         self._signal = Signals.NONE
 
         if  inTrade == 0 and \
-            float(s2[f'STOCHk_{self.medium}_3_{self.smooth_k}'].iloc[-2]) <= 20 and \
-            float(s1[f'STOCHk_{self.short}_3_{self.smooth_k}'].iloc[-2]) <= 20 and \
-            float(s1[f'STOCHk_{self.short}_3_{self.smooth_k}'].iloc[-1]) > 20:
+            self.s2.previous <= 20 and \
+            self.s1.previous <= 20 and \
+            self.s1.value > 20:
                 self._signal = Signals.BUY
-                self.trail = df['low'].rolling(window=self.trail_lookback).min().iloc[-1]-1
+                self.trail = self.lowMin.value-1
                 pass
 
         elif  inTrade == 0 and \
-            float(s2[f'STOCHk_{self.medium}_3_{self.smooth_k}'].iloc[-2]) >= 80 and \
-            float(s1[f'STOCHk_{self.short}_3_{self.smooth_k}'].iloc[-2]) >= 80 and \
-            float(s1[f'STOCHk_{self.short}_3_{self.smooth_k}'].iloc[-1]) < 80:
+            self.s2.previous >= 80 and \
+            self.s1.previous >= 80 and \
+            self.s1.value < 80:
                 self._signal = Signals.SHORT  
-                self.trail = df['high'].rolling(window=self.trail_lookback).max().iloc[-1]+1
+                self.trail = self.highMax.value+1
                 pass
         
-        elif inTrade > 0 and  df['low'].iloc[-1] <= self.trail:
+        elif inTrade > 0 and  bar.low <= self.trail:
             self._signal = Signals.SELL
 
-        elif inTrade < 0 and df['high'].iloc[-1] >= self.trail:
+        elif inTrade < 0 and bar.high >= self.trail:
             self._signal = Signals.COVER
 
 
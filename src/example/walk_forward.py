@@ -0,0 +1,32 @@
+import logging
+
+import pandas as pd
+
+from ibkr_sim.optimizer import Optimize
+from ibkr_sim.walk_forward import WalkForward
+from example import stats
+from example.sim import Trader, load_data
+
+logger = logging.getLogger()
+
+
+def backtest(ContractData, start, indicators=None, **params):
+    trader = Trader(ContractData=ContractData, indicators=indicators, **params)
+    trader.backtest(start)
+    return {**trader.metrics(), 'trades': trader.trade_results.copy()}
+
+
+if __name__ == "__main__":
+    params = {**Optimize('smooth_k', 1, 1, 5, 1), **Optimize('trail_lookback', 4, 1, 10, 1)}
+    wf = WalkForward(load_data(startDateStr="2021-06-01"), backtest, train='2 M', test='1 M', warmup='30 D')
+    result = wf.run(params)
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', 1000)
+    logger.info(result.folds)
+    if not result.trades.empty:
+        trades, risk_free_rate = result.trades, 5.0
+        logger.info(f"Out-of-sample: Trades={len(trades)}\t TotalProfit={stats.TotalProfit(trades):.2f}\t "
+                    f"WinRatio={stats.WinRatio(trades):.2f}\t MaxSystemDrawdown={stats.MaxSystemDrawdown(trades):.2f}")
+        logger.info(f"SharpeRatio={stats.SharpeRatio(trades, risk_free_rate):.2f}\t "
+                    f"ProfitFactor={stats.ProfitFactor(trades):.2f}\t Expectancy={stats.Expectancy(trades):.2f}")
+        logger.info(result.equity)
@@ -0,0 +1,110 @@
+"""Simulated account values with coalesced updates."""
+
+from typing import Dict, Set
+
+from ib_async.contract import Contract
+from ib_async.wrapper import Wrapper
+
+# unsolicited updates, kept out of the client's request id sequence
+UpdateReqId = -1
+
+
+class AccountState:
+    """
+    Cash, PnL and mark-to-market of the simulated account.
+
+    Fills and prices only update the state and mark what changed: a price
+    moves the unrealized PnL of an open position, a flat contract costs a
+    dict store. :meth:`flush` sends the changed portfolio items and account
+    values to the wrapper; :meth:`newBar` calls it every ``everyBars`` bars
+    or ``everySeconds`` simulated seconds (0 turns a limit off), so with
+    the defaults changes go out once per bar. Flush before reading the
+    wrapper's ``accountValues``/``portfolio`` for exact values.
+    """
+
+    def __init__(self, wrapper: Wrapper, account: str, cash: float,
+                 everyBars: int = 1, everySeconds: float = 0):
+        self.wrapper = wrapper
+        self.account = account
+        self.cash = cash
+        self.realizedPnL = 0.0
+        self.everyBars = everyBars
+        self.everySeconds = everySeconds
+        self.lastPrice: Dict[int, float] = {}
+        self._contracts: Dict[int, Contract] = {}
+        self._unrealized: Dict[int, float] = {}
+        self._dirty: Set[str] = set()
+        self._dirtyPositions: Set[int] = set()
+        self._bars = 0
+        self._lastFlush = None
+
+    def __getstate__(self) -> dict:
+        # snapshots pickle the values only, the restoring client sets its wrapper
+        state = self.__dict__.copy()
+        state['wrapper'] = None
+        return state
+
+    @property
+    def unrealizedPnL(self) -> float:
+        return sum(self._unrealized.values(), 0.0)
+
+    def mark(self, conId: int, price: float):
+        """Last traded price of a contract."""
+        self.lastPrice[conId] = price
+        if conId in self._contracts:
+            self._dirtyPositions.add(conId)
+            self._dirty.add('UnrealizedPnL')
+
+    def fill(self, contract: Contract, realizedPnL: float, commission: float):
+        """Book a fill; the position itself is read back from the wrapper on flush."""
+        self.cash += realizedPnL - commission
+        self.realizedPnL += realizedPnL
+        self._contracts[contract.conId] = contract
+        self._dirtyPositions.add(contract.conId)
+        self._dirty.update(('TotalCashBalance', 'RealizedPnL', 'UnrealizedPnL'))
+
+    def newBar(self, now: float):
+        """Count a replayed bar and flush when the update interval has passed."""
+        self._bars += 1
+        if self._lastFlush is None:
+            self._lastFlush = now
+        if ((self.everyBars and self._bars >= self.everyBars)
+                or (self.everySeconds and now - self._lastFlush >= self.everySeconds)):
+            self._bars = 0
+            self._lastFlush = now
+            self.flush()
+
+    def flush(self):
+        """Send the portfolio items and account values changed since the last flush."""
+        if not self._dirty and not self._dirtyPositions:
+            return
+        wrapper = self.wrapper
+        positions = wrapper.positions[self.account]
+        for conId in self._dirtyPositions:
+            contract = self._contracts[conId]
+            pos = positions.get(conId)
+            size = pos.position if pos else 0.0
+            avgCost = pos.avgCost if pos else 0.0
+            price = self.lastPrice.get(conId, avgCost)
+            multiplier = float(contract.multiplier or 1)
+            unrealized = size * (price - avgCost) * multiplier
+            wrapper.updatePortfolio(contract, size, price, size * price * multiplier, avgCost,
+                                    unrealized, self.realizedPnL, self.account)
+            if size:
+                self._unrealized[conId] = unrealized
+            else:
+                # flat contracts drop out until the next fill
+                self._unrealized.pop(conId, None)
+                del self._contracts[conId]
+        self._dirtyPositions.clear()
+        if self._dirty:
+            values = {
+                'TotalCashBalance': f'{self.cash:.2f}',
+                'UnrealizedPnL': f'{self.unrealizedPnL}',
+                'RealizedPnL': f'{self.realizedPnL}',
+            }
+            for tag in self._dirty:
+                wrapper.accountUpdateMulti(reqId=UpdateReqId, account=self.account, tag=tag, val=values[tag],
+                                           currency='BASE', modelCode='')
+            wrapper.accountUpdateMultiEnd(UpdateReqId)
+            self._dirty.clear()
@@ -0,0 +1,121 @@
+"""On-disk cache of converted bar arrays, memory-mapped on load."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import fields
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ibkr_sim.bar_store import SymbolBars
+
+_logger = logging.getLogger('ibkr_sim.bar_cache')
+
+
+class BarCache:
+    """
+    Cache of SymbolBars as one ``.npy`` file per column under ``directory``.
+
+    Entries are keyed by the source file (path, mtime and size), symbol and
+    date range, so editing the source misses the old entry. Loads map the
+    files read-only with ``np.load(mmap_mode='r')``: nothing is parsed or
+    copied, and processes loading the same entry share the pages through
+    the OS page cache. Entries are written to a temporary directory and
+    renamed into place, so concurrent writers never expose a partial entry.
+    When the cache grows past ``maxBytes`` the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, directory: str, maxBytes: int = 4 << 30):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source: str, symbol: str, startDateStr: str = '', endDateStr: str = '') -> str:
+        source = os.path.abspath(source)
+        st = os.stat(source)
+        ident = json.dumps([source, st.st_mtime_ns, st.st_size, symbol, startDateStr, endDateStr])
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[SymbolBars]:
+        path = self._path(key)
+        try:
+            bars = SymbolBars(*(np.load(os.path.join(path, f'{f.name}.npy'), mmap_mode='r')
+                                for f in fields(SymbolBars)))
+        except (FileNotFoundError, ValueError):
+            return None
+        # the entry directory's mtime records the last use for eviction
+        os.utime(path)
+        return bars
+
+    def put(self, key: str, bars: SymbolBars, source: str = '') -> SymbolBars:
+        """Store ``bars`` and return the memory-mapped copy."""
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            for f in fields(SymbolBars):
+                np.save(os.path.join(tmp, f'{f.name}.npy'), np.ascontiguousarray(getattr(bars, f.name)))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+                json.dump({'source': os.path.abspath(source) if source else '', 'bars': len(bars)}, fp)
+            try:
+                os.replace(tmp, self._path(key))
+            except OSError:
+                # another process stored the same entry first
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return self.get(key)
+
+    def load(self, source: str, symbol: str, loader: Callable[[], pd.DataFrame],
+             startDateStr: str = '', endDateStr: str = '') -> SymbolBars:
+        """
+        Bars of ``symbol`` from ``source``. On a miss ``loader()`` is called for
+        the frame (e.g. a ``load_db`` or ``load_csv`` partial) and the result cached.
+        """
+        key = self.key(source, symbol, startDateStr, endDateStr)
+        bars = self.get(key)
+        if bars is None:
+            _logger.info(f'{symbol}: bar cache miss, loading {source}')
+            bars = self.put(key, SymbolBars.fromFrame(loader()), source)
+        return bars
+
+    def entries(self):
+        """(key, size in bytes, last use) of every entry."""
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.startswith('.'):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                yield entry.name, size, entry.stat().st_mtime
+
+    def evict(self, keep: str = ''):
+        """Remove least recently used entries until the cache fits ``maxBytes``."""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.maxBytes:
+                break
+            if key != keep:
+                shutil.rmtree(self._path(key), ignore_errors=True)
+                total -= size
+
+    def invalidate(self, source: str = ''):
+        """Drop the entries of ``source``, or every entry when no source is given."""
+        source = os.path.abspath(source) if source else ''
+        for key, _, _ in list(self.entries()):
+            if source:
+                try:
+                    with open(os.path.join(self._path(key), 'meta.json')) as fp:
+                        if json.load(fp)['source'] != source:
+                            continue
+                except (OSError, ValueError, KeyError):
+                    pass
+            shutil.rmtree(self._path(key), ignore_errors=True)
@@ -0,0 +1,159 @@
+"""Bar containers for long replays."""
+
+from collections.abc import Sequence
+from dataclasses import fields
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from eventkit import Event
+
+from ib_async.contract import Contract, TagValue
+from ib_async.objects import BarData, BarDataList
+
+from ibkr_sim.bar_store import SymbolBars
+
+
+class BoundedBarDataList(BarDataList):
+    """
+    BarDataList holding at most the last ``maxBars`` bars; appending to a
+    full list drops the oldest bar, so memory stays flat however long the
+    replay runs. It is still a plain ordered list underneath, so indexing,
+    negative slices, ``util.df`` and ``updateEvent`` work as before.
+    """
+
+    def __init__(self, maxBars: int, *args):
+        super().__init__(*args)
+        self.maxBars = maxBars
+        self._trim()
+
+    def append(self, bar: BarData):
+        if len(self) >= self.maxBars:
+            del self[0]
+        super().append(bar)
+
+    def extend(self, bars: Iterable[BarData]):
+        super().extend(bars)
+        self._trim()
+
+    def __iadd__(self, bars: Iterable[BarData]):
+        self.extend(bars)
+        return self
+
+    def __reduce__(self):
+        # unpickling extends the list with its bars, so maxBars must be set before
+        return self.__class__, (self.maxBars,), self.__dict__, iter(self)
+
+    def _trim(self):
+        excess = len(self) - self.maxBars
+        if excess > 0:
+            del self[:excess]
+
+
+class ArrayBarDataList(Sequence):
+    """
+    BarDataList stand-in backed by the replay's SymbolBars arrays.
+
+    It covers the rows ``start`` to ``end`` of the contract's bars; the
+    replay extends it by moving ``end``, so no per-bar objects are kept.
+    Indexing builds the BarData of a row on access and slices build a list
+    of them, so code written against BarDataList keeps working, while
+    :meth:`window` and :meth:`arrays` hand out the last bars as views on
+    the arrays without building any BarData. With ``maxBars`` only the
+    last ``maxBars`` rows are covered.
+
+    Events:
+        * ``updateEvent`` (bars: ArrayBarDataList, hasNewBar: bool)
+    """
+
+    reqId: int
+    contract: Contract
+    endDateTime: Union[datetime, date, str, None]
+    durationStr: str
+    barSizeSetting: str
+    whatToShow: str
+    useRTH: bool
+    formatDate: int
+    keepUpToDate: bool
+    chartOptions: List[TagValue]
+
+    def __init__(self, maxBars: int = 0):
+        self.maxBars = maxBars
+        self.bars: Optional[SymbolBars] = None
+        self.start = self.end = 0
+        self.updateEvent = Event('updateEvent')
+
+    def attach(self, bars: SymbolBars, start: int, end: int):
+        """Cover rows ``start`` to ``end`` of ``bars``."""
+        self.bars = bars
+        self.start = start
+        self.advance(end)
+
+    def advance(self, end: int):
+        """Extend the list up to row ``end``."""
+        self.end = end
+        if self.maxBars:
+            self.start = max(self.start, end - self.maxBars)
+
+    def clear(self):
+        self.start = self.end
+
+    def __getstate__(self) -> dict:
+        # pickled without the arrays; a restored list is attached to the store again
+        state = self.__dict__.copy()
+        state['bars'] = None
+        return state
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.bars.barList(self.start + start, self.start + max(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('bar index out of range')
+        return self.bars.bar(self.start + index)
+
+    def __iter__(self) -> Iterator[BarData]:
+        for i in range(self.start, self.end, SymbolBars.chunkSize):
+            yield from self.bars.barList(i, min(i + SymbolBars.chunkSize, self.end))
+
+    def __eq__(self, other) -> bool:
+        return self is other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f'ArrayBarDataList(len={len(self)})'
+
+    def _range(self, n: Optional[int]) -> Tuple[int, int]:
+        return (self.start if n is None else max(self.start, self.end - n)), self.end
+
+    def arrays(self, n: int = None) -> Dict[str, np.ndarray]:
+        """Views on the arrays of the last ``n`` bars (all bars when None): ts in epoch seconds and OHLCV."""
+        start, end = self._range(n)
+        return {f.name: getattr(self.bars, f.name)[start:end] for f in fields(SymbolBars)}
+
+    def window(self, n: int = None) -> pd.DataFrame:
+        """
+        The last ``n`` bars (all bars when None) as a DataFrame with the
+        ``util.df`` columns that shares memory with the bar arrays; take a
+        copy to modify it or keep it past the next bars.
+        """
+        start, end = self._range(n)
+        b = self.bars
+        return pd.DataFrame({
+            'date': b.ts[start:end].view('datetime64[s]'),
+            'open': b.open[start:end],
+            'high': b.high[start:end],
+            'low': b.low[start:end],
+            'close': b.close[start:end],
+            'volume': b.volume[start:end],
+        }, copy=False)
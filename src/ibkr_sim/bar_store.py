@@ -0,0 +1,215 @@
+"""Columnar bar storage used by the simulated replay."""
+
+from dataclasses import dataclass, fields
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ib_async.objects import BarData
+
+from ibkr_sim.sim_clock import toDatetime
+
+Row = Tuple[int, int, float, float, float, float, float]
+
+_barSizeUnits = {
+    'sec': 1, 'secs': 1,
+    'min': 60, 'mins': 60,
+    'hour': 3600, 'hours': 3600,
+    'day': 86400, 'days': 86400,
+    'week': 7 * 86400, 'weeks': 7 * 86400,
+}
+
+
+def barSizeSeconds(barSizeSetting: str) -> int:
+    """Length in seconds of an IB ``barSizeSetting`` such as '15 mins' or '1 hour'."""
+    try:
+        count, unit = barSizeSetting.split()
+        return int(count) * _barSizeUnits[unit.lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f'Unsupported barSizeSetting {barSizeSetting!r}')
+
+
+# weekly buckets start on Sunday like IB's, the epoch is a Thursday
+_weekOrigin = 3 * 86400
+
+
+def bucketStart(ts, seconds: int):
+    """Start of the ``seconds`` bar holding epoch seconds ``ts`` (an int or an array)."""
+    origin = _weekOrigin if seconds % (7 * 86400) == 0 else 0
+    return ts - (ts - origin) % seconds
+
+
+@dataclass
+class SymbolBars:
+    """Bars of one contract as contiguous arrays: int64 epoch seconds and float64 OHLCV."""
+
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    chunkSize = 4096
+
+    @classmethod
+    def fromFrame(cls, df: pd.DataFrame) -> 'SymbolBars':
+        """Convert a frame with date, open, high, low, close and volume columns. Naive dates are UTC."""
+        dates = pd.to_datetime(df['date'], format='mixed')
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+        ts = dates.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        return cls(
+            ts=np.ascontiguousarray(ts),
+            open=np.ascontiguousarray(df['open'], dtype=np.float64),
+            high=np.ascontiguousarray(df['high'], dtype=np.float64),
+            low=np.ascontiguousarray(df['low'], dtype=np.float64),
+            close=np.ascontiguousarray(df['close'], dtype=np.float64),
+            volume=np.ascontiguousarray(df['volume'], dtype=np.float64))
+
+    @classmethod
+    def fromChunks(cls, chunks: Iterable[pd.DataFrame]) -> 'SymbolBars':
+        """Convert a stream of frames, holding only the arrays rather than the whole frame."""
+        parts = [cls.fromFrame(df) for df in chunks]
+        if not parts:
+            return cls.fromFrame(pd.DataFrame(columns=['date', 'open', 'high', 'low', 'close', 'volume']))
+        return cls(*(np.concatenate([getattr(p, f.name) for p in parts]) for f in fields(cls)))
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @cached_property
+    def barSize(self) -> int:
+        """Seconds between bars, taken as the smallest step so session gaps don't count."""
+        steps = np.diff(self.ts)
+        steps = steps[steps > 0]
+        return int(steps.min()) if len(steps) else 0
+
+    def aggregate(self, seconds: int) -> 'Aggregate':
+        """
+        Bars of ``seconds`` length as a vectorized group reduction. Buckets are
+        aligned on multiples of ``seconds`` since the epoch, weeks since a Sunday,
+        and carry their start time, see :func:`bucketStart`.
+        """
+        bucket = bucketStart(self.ts, seconds)
+        if not len(bucket):
+            return Aggregate(self, self, np.zeros(0, dtype=np.int64), seconds)
+        first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        last = np.r_[first[1:], len(bucket)] - 1
+        bars = SymbolBars(
+            ts=bucket[first],
+            open=self.open[first],
+            high=np.maximum.reduceat(self.high, first),
+            low=np.minimum.reduceat(self.low, first),
+            close=self.close[last],
+            volume=np.add.reduceat(self.volume, first))
+        return Aggregate(self, bars, first, seconds)
+
+    def bar(self, i: int) -> BarData:
+        """BarData for row ``i``."""
+        return BarData(
+            date=toDatetime(int(self.ts[i])),
+            open=float(self.open[i]),
+            high=float(self.high[i]),
+            low=float(self.low[i]),
+            close=float(self.close[i]),
+            volume=float(self.volume[i]),
+            average=0.0,
+            barCount=i)
+
+    def barList(self, start: int, stop: int) -> List[BarData]:
+        """BarData of rows ``start`` to ``stop`` in one pass over the unpacked rows."""
+        return [BarData(toDatetime(ts), o, h, l, c, v, 0.0, i) for i, ts, o, h, l, c, v in self.rows(start, stop)]
+
+    def rows(self, start: int = 0, stop: int = None) -> Iterator[Row]:
+        """
+        Iterate (index, ts, open, high, low, close, volume) as Python scalars.
+        Rows are unpacked a chunk at a time so no per-element NumPy scalars are built.
+        """
+        stop = len(self) if stop is None else stop
+        for i in range(start, stop, self.chunkSize):
+            j = min(i + self.chunkSize, stop)
+            yield from zip(
+                range(i, j),
+                self.ts[i:j].tolist(),
+                self.open[i:j].tolist(),
+                self.high[i:j].tolist(),
+                self.low[i:j].tolist(),
+                self.close[i:j].tolist(),
+                self.volume[i:j].tolist())
+
+
+@dataclass
+class Aggregate:
+    """Coarser bars built from a base series, with the base row each bar starts at."""
+
+    base: SymbolBars
+    bars: SymbolBars
+    first: np.ndarray
+    seconds: int
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def count(self, end: int) -> int:
+        """Number of bars, the last one possibly partial, covering base rows before ``end``."""
+        return int(self.first.searchsorted(end, side='left'))
+
+    def end(self, k: int) -> int:
+        """Base row after the first ``k`` complete bars."""
+        return int(self.first[k]) if k < len(self.first) else len(self.base)
+
+    def barList(self, start: int, end: int) -> List[BarData]:
+        """Bars covering base rows ``start`` to ``end``, the last one reduced from the rows before ``end``."""
+        k0 = self.count(start + 1) - 1 if start < end else self.count(start)
+        k = self.count(end)
+        if k <= k0:
+            return []
+        bars = self.bars.barList(k0, k - 1)
+        bars.append(self.bar(k - 1, end))
+        return bars
+
+    def bar(self, k: int, end: int = None) -> BarData:
+        """
+        BarData of bar ``k`` as seen when only the base rows before ``end`` are
+        known; the bar in progress is reduced from those rows alone.
+        """
+        if end is None or end >= self.end(k + 1):
+            return self.bars.bar(k)
+        b, i = self.base, int(self.first[k])
+        return BarData(
+            date=toDatetime(int(self.bars.ts[k])),
+            open=float(b.open[i]),
+            high=float(b.high[i:end].max()),
+            low=float(b.low[i:end].min()),
+            close=float(b.close[end - 1]),
+            volume=float(b.volume[i:end].sum()),
+            average=0.0,
+            barCount=k)
+
+
+class BarStore(Dict[str, SymbolBars]):
+    """
+    Symbol -> SymbolBars, converted once from the ``ContractData`` frames.
+    An entry can carry ready-made SymbolBars under ``'bars'`` instead of a ``'df'``.
+    Coarser bar sizes are built on first use and shared by every request.
+    """
+
+    def __init__(self, ContractData: dict):
+        super().__init__()
+        self._aggregates: Dict[Tuple[str, int], Aggregate] = {}
+        for symbol, data in ContractData.items():
+            bars = data.get('bars')
+            self[symbol] = bars if bars is not None else SymbolBars.fromFrame(data['df'])
+
+    def aggregate(self, symbol: str, seconds: int) -> Optional[Aggregate]:
+        """Bars of ``symbol`` rolled up to ``seconds``, None when that is the base size or finer."""
+        base = self[symbol]
+        if seconds <= base.barSize:
+            return None
+        key = (symbol, seconds)
+        if key not in self._aggregates:
+            self._aggregates[key] = base.aggregate(seconds)
+        return self._aggregates[key]
@@ -0,0 +1,82 @@
+"""Vectorized backtest for strategies expressed as signal or target-position arrays."""
+
+import numpy as np
+import pandas as pd
+
+from ibkr_sim.bar_store import BarStore
+from ibkr_sim.sim_client import SimClient, apply_fill
+
+
+class BatchSim:
+    """
+    Event-loop free counterpart of IBSim for strategies that are just arrays.
+
+    ``target[t]`` is the position the strategy asks for from its bar ``t``
+    update. Like a MKT order placed from that callback it fills at the open
+    of bar ``t + 1`` and is charged the SimClient commission model, so fills,
+    positions and the cash balance match the event-driven path bar for bar.
+    Bars before ``start`` (the warmup) never trade; NaN targets keep the
+    current position.
+    """
+
+    def __init__(self, ContractData, AccountBalance=100_000.00, commission=SimClient.commission):
+        self._contractData = ContractData
+        self._store = BarStore(ContractData)
+        self.AccountBalance = AccountBalance
+        self.commission = commission
+
+    def run(self, symbol: str, target=None, signal=None, qty: float = 1, start: int = 0) -> pd.DataFrame:
+        """
+        Backtest one contract from either a target-position array or a
+        -1/0/1 signal array traded in ``qty`` lots. Returns one row per bar.
+        """
+        bars = self._store[symbol]
+        multiplier = float(self._contractData[symbol]['ContractDetails'].contract.multiplier)
+        n = len(bars)
+        if target is None:
+            if signal is None:
+                raise ValueError('Either target or signal is required')
+            target = np.asarray(signal, dtype=np.float64) * qty
+        target = np.asarray(target, dtype=np.float64)
+        if len(target) != n:
+            raise ValueError(f'{symbol}: expected {n} targets, got {len(target)}')
+
+        wanted = np.zeros(n)
+        wanted[start:] = target[start:]
+        keep = np.isnan(wanted)
+        if keep.any():
+            last = np.maximum.accumulate(np.where(keep, 0, np.arange(n)))
+            # NaNs with no target before them keep the flat position
+            wanted = np.nan_to_num(wanted[last], nan=0.0)
+
+        # the order sent at bar t fills at the open of bar t + 1
+        fillQty = np.zeros(n)
+        fillQty[1:] = np.diff(wanted, prepend=0.0)[:-1]
+        position = np.cumsum(fillQty)
+        filled = np.flatnonzero(fillQty)
+        fillPrice = np.where(fillQty != 0, bars.open, np.nan)
+        commission = self.commission * np.abs(fillQty)
+
+        # average cost is path dependent, walk the fills only
+        realized = np.zeros(n)
+        avgAtFill = np.zeros(n)
+        pos, avg = 0.0, 0.0
+        for t, q, price in zip(filled.tolist(), fillQty[filled].tolist(), bars.open[filled].tolist()):
+            pos, avg, realized[t] = apply_fill(pos, avg, q, price, multiplier)
+            avgAtFill[t] = avg
+        lastFill = np.maximum.accumulate(np.where(fillQty != 0, np.arange(n), 0))
+        avgCost = avgAtFill[lastFill]
+
+        cash = self.AccountBalance + np.cumsum(realized - commission)
+        unrealized = np.where(position != 0, position * (bars.close - avgCost) * multiplier, 0.0)
+        return pd.DataFrame({
+            'date': bars.ts.astype('datetime64[s]'),
+            'position': position,
+            'fill_qty': fillQty,
+            'fill_price': fillPrice,
+            'commission': commission,
+            'realized_pnl': realized,
+            'cash': cash,
+            'unrealized_pnl': unrealized,
+            'equity': cash + unrealized,
+        })
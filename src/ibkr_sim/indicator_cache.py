@@ -0,0 +1,52 @@
+"""Indicator series computed once per parameter set and shared by the runs over any date range."""
+
+from typing import Callable, Dict, Hashable, Tuple
+
+import numpy as np
+
+from ibkr_sim.bar_store import SymbolBars
+
+Indicator = Callable[..., np.ndarray]
+
+
+class IndicatorCache:
+    """
+    Whole-series indicators of the bars in ``bars`` (symbol -> SymbolBars).
+
+    ``compute(bars, *args)`` must return one value per bar and depend only
+    on the bars up to each one, like a rolling window. It runs once per
+    symbol and ``(compute, *args)``; :meth:`get` then returns the slice
+    lined up with the bars a run replays, any range of the series, so runs
+    over overlapping date ranges share the work. Values near the start of
+    a range were computed from the bars before it, which is what a run
+    warmed up over its window sees.
+    """
+
+    def __init__(self, bars: Dict[str, SymbolBars]):
+        self.bars = bars
+        self.hits = 0
+        self.misses = 0
+        self._series: Dict[Tuple[str, Indicator, Tuple[Hashable, ...]], np.ndarray] = {}
+
+    def series(self, symbol: str, compute: Indicator, *args) -> np.ndarray:
+        """``compute(bars, *args)`` over all the bars of ``symbol``."""
+        key = (symbol, compute, args)
+        values = self._series.get(key)
+        if values is None:
+            self.misses += 1
+            values = self._series[key] = compute(self.bars[symbol], *args)
+        else:
+            self.hits += 1
+        return values
+
+    def get(self, symbol: str, bars: SymbolBars, compute: Indicator, *args) -> np.ndarray:
+        """Values for ``bars``, a contiguous range of the bars of ``symbol``, one per bar."""
+        values = self.series(symbol, compute, *args)
+        if not len(bars):
+            return values[:0]
+        start = int(self.bars[symbol].ts.searchsorted(bars.ts[0]))
+        return values[start:start + len(bars)]
+
+    def clear(self):
+        self._series.clear()
+        self.hits = self.misses = 0
@@ -0,0 +1,78 @@
+"""Parameter sweeps of IBSim backtests across a process pool."""
+
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from ibkr_sim.bar_store import BarStore
+from ibkr_sim.shared_bars import SharedBars, Spec
+
+Backtest = Callable[..., Dict[str, float]]
+
+# per worker process: (shared bars, ContractData over them, backtest)
+_worker = None
+
+
+def _initWorker(spec: Spec, meta: dict, backtest: Backtest):
+    global _worker
+    shared = SharedBars.attach(spec)
+    ContractData = {symbol: {**data, 'bars': shared.bars[symbol]} for symbol, data in meta.items()}
+    _worker = (shared, ContractData, backtest)
+
+
+def _runOne(params: dict) -> dict:
+    _, ContractData, backtest = _worker
+    return {**params, **backtest(ContractData, **params)}
+
+
+def Optimize(name: str, default, min_, max_, step) -> Dict[str, List]:
+    """Parameter range in the AmiBroker ``Optimize(name, default, min, max, step)`` form."""
+    count = int(math.floor((max_ - min_) / step + 1e-9)) + 1
+    return {name: [min_ + k * step for k in range(count)]}
+
+
+class Optimizer:
+    """
+    Runs a backtest for every combination of a parameter grid on a process pool.
+
+    ``backtest(ContractData, **params)`` must be a module level function that
+    builds its own IBSim from ``ContractData`` and returns a dict of metrics.
+    The bar arrays are converted once and published through shared memory,
+    so each worker maps them instead of unpickling or reloading the data;
+    the frames are not sent to the workers at all.
+    """
+
+    def __init__(self, ContractData: dict, backtest: Backtest, workers: Optional[int] = None, mp_context=None):
+        self._store = BarStore(ContractData)
+        self._meta = {symbol: {k: v for k, v in data.items() if k not in ('df', 'bars')}
+                      for symbol, data in ContractData.items()}
+        self.backtest = backtest
+        self.workers = workers or os.cpu_count() or 1
+        self.mp_context = mp_context
+
+    @staticmethod
+    def grid(params: Dict[str, Iterable]) -> List[dict]:
+        """Cartesian product of the parameter ranges as a list of keyword dicts."""
+        names = list(params)
+        return [dict(zip(names, values)) for values in itertools.product(*(params[n] for n in names))]
+
+    def run(self, params: Dict[str, Iterable]) -> pd.DataFrame:
+        """Backtest every combination, one row of parameters and metrics per run in grid order."""
+        grid = self.grid(params)
+        if not grid:
+            return pd.DataFrame()
+        workers = min(self.workers, len(grid))
+        # a few chunks per worker keeps the pool busy without per task IPC
+        chunksize = max(1, len(grid) // (workers * 4))
+        with SharedBars.publish(self._store) as shared:
+            with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=self.mp_context,
+                    initializer=_initWorker,
+                    initargs=(shared.spec, self._meta, self.backtest)) as pool:
+                rows = list(pool.map(_runOne, grid, chunksize=chunksize))
+        return pd.DataFrame(rows)
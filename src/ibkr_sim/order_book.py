@@ -0,0 +1,420 @@
+"""Index of the resting simulated orders."""
+
+import heapq
+import itertools
+import math
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from ib_async.order import Trade
+from ib_async.util import UNSET_DOUBLE
+
+Key = Tuple[float, int]
+
+OrderTypes = {"MKT", "LMT", "STP", "STP LMT", "TRAIL", "TRAIL LIMIT"}
+
+
+class PriceLevels:
+    """Orders of one (contract, side, kind) sorted by price, FIFO within a price."""
+
+    def __init__(self):
+        self.keys: List[Key] = []
+        self.trades: Dict[Key, Trade] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: Key, trade: Trade):
+        insort(self.keys, key)
+        self.trades[key] = trade
+
+    def remove(self, key: Key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.trades[key]
+
+    def popAbove(self, price: float) -> List[Trade]:
+        """Remove and return the orders priced at or above ``price``."""
+        i = bisect_left(self.keys, (price,))
+        keys = self.keys[i:]
+        del self.keys[i:]
+        return [self.trades.pop(k) for k in keys]
+
+    def popBelow(self, price: float) -> List[Trade]:
+        """Remove and return the orders priced at or below ``price``."""
+        i = bisect_left(self.keys, (price, math.inf))
+        keys = self.keys[:i]
+        del self.keys[:i]
+        return [self.trades.pop(k) for k in keys]
+
+
+class OrderBook:
+    """
+    Active orders keyed by contract and side.
+
+    MKT orders queue FIFO per contract. LMT and STP orders rest in
+    price-sorted levels, so the orders a bar triggers are found with one
+    binary search per side and the cost scales with the number of
+    triggered orders rather than the history of the run. TRAIL and
+    TRAIL LIMIT orders are kept per contract and their stop is moved with
+    every bar's extreme. Filled and cancelled orders leave the index
+    straight away.
+
+    Children of a resting parent (``parentId``, as ``BracketOrder`` sets
+    it) are held until the parent fills. Orders sharing an ``ocaGroup``,
+    and the children of one parent, are grouped: a fill cancels the rest
+    of its group (or, with ocaType 2 and 3, reduces them by the filled
+    quantity) through a dict lookup. Orders cancelled and children
+    released by a ``match`` are left on ``cancelled`` and ``activated``
+    for the caller to report.
+    """
+
+    def __init__(self):
+        self._market: Dict[int, List[Trade]] = defaultdict(list)
+        self._levels: Dict[Tuple[int, str, str], PriceLevels] = defaultdict(PriceLevels)
+        self._index: Dict[int, Tuple[Tuple[int, str, str], Key]] = {}
+        self._trailing: Dict[int, Dict[int, Trade]] = defaultdict(dict)
+        self._held: Dict[int, List[Trade]] = defaultdict(list)
+        self._live: Dict[int, Trade] = {}
+        self._groups: Dict[Tuple[str, object], Dict[int, Trade]] = defaultdict(dict)
+        self._seq = itertools.count()
+        self.cancelled: List[Trade] = []
+        self.activated: List[Trade] = []
+
+    def __getstate__(self) -> dict:
+        # itertools.count doesn't pickle from python 3.14, keep its next value
+        state = self.__dict__.copy()
+        state['_seq'] = next(self._seq)
+        self._seq = itertools.count(state['_seq'])
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._seq = itertools.count(state['_seq'])
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def add(self, trade: Trade) -> bool:
+        """Index a submitted order. Returns False for order types the simulator can't fill."""
+        order = trade.order
+        if order.orderType not in OrderTypes:
+            return False
+        self._live[order.orderId] = trade
+        for key in self._groupKeys(order):
+            self._groups[key][id(trade)] = trade
+        if order.parentId and order.parentId in self._live:
+            self._held[order.parentId].append(trade)
+        else:
+            self._rest(trade)
+        return True
+
+    def held(self, trade: Trade) -> bool:
+        """Whether the order waits for its parent to fill."""
+        return trade in self._held.get(trade.order.parentId, ())
+
+    def remove(self, trade: Trade) -> List[Trade]:
+        """Remove a cancelled order. Returns its held children, which are removed with it."""
+        order = trade.order
+        if self._live.pop(order.orderId, None) is None:
+            return []
+        self._unindex(trade)
+        for key in self._groupKeys(order):
+            group = self._groups.get(key)
+            if group is not None:
+                group.pop(id(trade), None)
+                if not group:
+                    del self._groups[key]
+        removed = []
+        for child in self._held.pop(order.orderId, ()):
+            removed += [child] + self.remove(child)
+        return removed
+
+    def modify(self, trade: Trade) -> bool:
+        """Re-index a modified order at its new prices. Returns False for order types the simulator can't fill."""
+        if trade.order.orderType not in OrderTypes:
+            return False
+        if trade.order.orderId not in self._live:
+            return self.add(trade)
+        if not self.held(trade):
+            self._unindex(trade)
+            self._rest(trade)
+        return True
+
+    def _rest(self, trade: Trade):
+        order = trade.order
+        conId = trade.contract.conId
+        match order.orderType:
+            case "MKT":
+                self._market[conId].append(trade)
+                return
+            case "LMT":
+                book, price = (conId, order.action, "LMT"), order.lmtPrice
+            case "STP" | "STP LMT":
+                book, price = (conId, order.action, "STP"), order.auxPrice
+            case "TRAIL" | "TRAIL LIMIT":
+                self._trailing[conId][id(trade)] = trade
+                return
+        key = (price, next(self._seq))
+        self._levels[book].add(key, trade)
+        self._index[id(trade)] = (book, key)
+
+    def _unindex(self, trade: Trade):
+        entry = self._index.pop(id(trade), None)
+        if entry is not None:
+            book, key = entry
+            self._levels[book].remove(key)
+            return
+        conId = trade.contract.conId
+        if self._trailing[conId].pop(id(trade), None) is not None:
+            return
+        queue = self._market.get(conId)
+        if queue and trade in queue:
+            queue.remove(trade)
+            return
+        held = self._held.get(trade.order.parentId)
+        if held and trade in held:
+            held.remove(trade)
+
+    @staticmethod
+    def _groupKeys(order) -> List[Tuple[str, object]]:
+        keys = []
+        if order.ocaGroup:
+            keys.append(("oca", order.ocaGroup))
+        if order.parentId:
+            keys.append(("parent", order.parentId))
+        return keys
+
+    def match(self, conId: int, open_: float, high: float, low: float,
+              close: float = None) -> List[Tuple[Trade, float]]:
+        """
+        Remove and return (trade, fill price) for every order of the contract
+        a bar triggers. MKT orders fill at the open; LMT and STP orders at their
+        price, or at the open when the bar gaps through it. A triggered
+        STP LMT becomes a LMT order and fills if its limit is inside the bar.
+
+        Triggered orders are filled in the order the bar path (O-L-H-C when
+        ``close`` is at or above the open, O-H-L-C otherwise) reaches them,
+        so when both legs of a bracket or OCA group trigger in one bar the
+        one reached first fills and the other is cancelled. Children released
+        by a fill are matched on the rest of the path from the fill on, so a
+        bracket's stop is hit in the bar its parent filled in; trailing
+        children start trailing with the next bar.
+        """
+        up = close is None or close >= open_
+        path = (open_, low, high) if up else (open_, high, low)
+        if close is not None:
+            path += (close,)
+
+        def priceAt(pos):
+            leg, distance = pos
+            if leg == 0:
+                return open_
+            start, end = path[leg - 1], path[leg]
+            return start - distance if end < start else start + distance
+
+        def falling(price, pos=(0, 0.0)):
+            # (leg, distance along the leg) where the path from pos first trades at or below price
+            if priceAt(pos) <= price:
+                return pos
+            for leg in range(max(pos[0], 1), len(path)):
+                if path[leg] <= price:
+                    return leg, path[leg - 1] - price
+            return None
+
+        def rising(price, pos=(0, 0.0)):
+            if priceAt(pos) >= price:
+                return pos
+            for leg in range(max(pos[0], 1), len(path)):
+                if path[leg] >= price:
+                    return leg, price - path[leg - 1]
+            return None
+
+        def released(trade, pos):
+            # (reached, fill price) of a child released at pos on the rest of the path, None if it isn't reached
+            order = trade.order
+            buy = order.action == "BUY"
+            match order.orderType:
+                case "MKT":
+                    return pos, priceAt(pos)
+                case "LMT":
+                    reached = falling(order.lmtPrice, pos) if buy else rising(order.lmtPrice, pos)
+                    if reached is None:
+                        return None
+                    price = priceAt(reached)
+                    return reached, min(price, order.lmtPrice) if buy else max(price, order.lmtPrice)
+                case "STP" | "STP LMT":
+                    reached = rising(order.auxPrice, pos) if buy else falling(order.auxPrice, pos)
+                    if reached is None:
+                        return None
+                    price = priceAt(reached)
+                    price = max(price, order.auxPrice) if buy else min(price, order.auxPrice)
+                    if order.orderType == "STP":
+                        return reached, price
+                    limit = falling(order.lmtPrice, reached) if buy else rising(order.lmtPrice, reached)
+                    if limit is None:
+                        return reached, None
+                    price = priceAt(limit)
+                    return limit, min(price, order.lmtPrice) if buy else max(price, order.lmtPrice)
+            return None
+
+        fills = [((0, 0.0), trade, open_) for trade in self._market.pop(conId, ())]
+        for trade in self._pop((conId, "BUY", "LMT"), low, above=True):
+            price = trade.order.lmtPrice
+            fills.append((falling(price), trade, min(open_, price)))
+        for trade in self._pop((conId, "SELL", "LMT"), high, above=False):
+            price = trade.order.lmtPrice
+            fills.append((rising(price), trade, max(open_, price)))
+        triggered = (self._pop((conId, "BUY", "STP"), high, above=False)
+                     + self._pop((conId, "SELL", "STP"), low, above=True))
+        for trade in triggered:
+            order = trade.order
+            stop = order.auxPrice
+            reached = rising(stop) if order.action == "BUY" else falling(stop)
+            if order.orderType == "STP":
+                price = max(open_, stop) if order.action == "BUY" else min(open_, stop)
+                fills.append((reached, trade, price))
+            elif order.action == "BUY" and order.lmtPrice >= low:
+                fills.append((reached, trade, min(max(open_, stop), order.lmtPrice)))
+            elif order.action == "SELL" and order.lmtPrice <= high:
+                fills.append((reached, trade, max(min(open_, stop), order.lmtPrice)))
+            else:
+                fills.append((reached, trade, None))
+        trailing = self._trailing.get(conId)
+        if trailing:
+            for trade in list(trailing.values()):
+                leg = self._trail(trade, open_, high, low, close, up)
+                if leg is None:
+                    continue
+                del trailing[id(trade)]
+                order = trade.order
+                stop = order.trailStopPrice
+                sell = order.action == "SELL"
+                if leg == 3:
+                    reached = (3, high - stop) if sell else (3, stop - low)
+                else:
+                    reached = falling(stop) if sell else rising(stop)
+                price = open_ if leg == 0 else stop
+                if order.orderType == "TRAIL LIMIT":
+                    order.lmtPrice = stop - order.lmtPriceOffset if sell else stop + order.lmtPriceOffset
+                    if (price < order.lmtPrice) if sell else (price > order.lmtPrice):
+                        price = None
+                fills.append((reached, trade, price))
+        fills.sort(key=lambda fill: fill[0])
+        # the seq keeps the path order stable and the trades out of the comparison
+        pending = [(reached, seq, trade, price) for seq, (reached, trade, price) in enumerate(fills)]
+        seq = len(pending)
+
+        result = []
+        cancelled = set()
+        while pending:
+            reached, _, trade, price = heapq.heappop(pending)
+            if id(trade) in cancelled:
+                continue
+            if price is None:
+                # triggered stop limit whose limit is outside the bar rests as a limit order
+                self._restLimit(trade)
+                continue
+            result.append((trade, price))
+            activated = len(self.activated)
+            for sibling in self._filled(trade):
+                cancelled.add(id(sibling))
+            for child in self.activated[activated:]:
+                fill = released(child, reached)
+                if fill is not None:
+                    self._unindex(child)
+                    heapq.heappush(pending, (fill[0], seq, child, fill[1]))
+                    seq += 1
+        return result
+
+    @staticmethod
+    def _trail(trade: Trade, open_: float, high: float, low: float, close: Optional[float], up: bool) -> Optional[int]:
+        """
+        Move the trailing stop of the order along the bar path, updating
+        ``trailStopPrice``. Returns the leg of the path (0 for the open) the
+        stop is hit on, or None while the order keeps trailing.
+        """
+        order = trade.order
+        if order.trailingPercent != UNSET_DOUBLE:
+            offset = lambda price: price * order.trailingPercent / 100
+        else:
+            offset = lambda price: order.auxPrice
+        stop = order.trailStopPrice
+        leg = None
+        if order.action == "SELL":
+            if stop == UNSET_DOUBLE:
+                stop = open_ - offset(open_)
+            if open_ <= stop:
+                leg = 0
+            elif up:
+                if low <= stop:
+                    leg = 1
+                else:
+                    stop = max(stop, high - offset(high))
+                    if close is not None and close <= stop:
+                        leg = 3
+            else:
+                stop = max(stop, high - offset(high))
+                if low <= stop:
+                    leg = 2
+        else:
+            if stop == UNSET_DOUBLE:
+                stop = open_ + offset(open_)
+            if open_ >= stop:
+                leg = 0
+            elif not up:
+                if high >= stop:
+                    leg = 1
+                else:
+                    stop = min(stop, low + offset(low))
+                    if close is not None and close >= stop:
+                        leg = 3
+            else:
+                stop = min(stop, low + offset(low))
+                if high >= stop:
+                    leg = 2
+        order.trailStopPrice = stop
+        return leg
+
+    def _restLimit(self, trade: Trade):
+        order = trade.order
+        key = (order.lmtPrice, next(self._seq))
+        book = (trade.contract.conId, order.action, "LMT")
+        self._levels[book].add(key, trade)
+        self._index[id(trade)] = (book, key)
+
+    def _filled(self, trade: Trade) -> List[Trade]:
+        """Drop a filled order, release its children and resolve its groups. Returns the orders cancelled."""
+        order = trade.order
+        self._live.pop(order.orderId, None)
+        for child in self._held.pop(order.orderId, ()):
+            self._rest(child)
+            self.activated.append(child)
+        cancelled = []
+        for key in self._groupKeys(order):
+            group = self._groups.pop(key, None)
+            if not group:
+                continue
+            group.pop(id(trade), None)
+            for sibling in group.values():
+                if key[0] == "oca" and order.ocaType in (2, 3):
+                    sibling.order.totalQuantity -= order.totalQuantity
+                    if sibling.order.totalQuantity > 0:
+                        self._groups[key][id(sibling)] = sibling
+                        continue
+                cancelled.append(sibling)
+        for sibling in cancelled:
+            removed = [sibling] + self.remove(sibling)
+            self.cancelled.extend(removed)
+        return cancelled
+
+    def _pop(self, book: Tuple[int, str, str], price: float, above: bool) -> List[Trade]:
+        levels = self._levels.get(book)
+        if not levels:
+            return []
+        trades = levels.popAbove(price) if above else levels.popBelow(price)
+        for trade in trades:
+            del self._index[id(trade)]
+        return trades
@@ -0,0 +1,122 @@
+"""Per-phase timing of a simulated run."""
+
+import functools
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+Phases = {
+    'matching': 'match_orders',
+    'execution': 'do_execution',
+    'portfolio': 'do_updateportfolio',
+    'ticks': 'replay_ticks',
+    'realtime': 'replay_realtime',
+    'barHandlers': 'emitBarUpdate',
+    'fillHandlers': 'emitCommissionReport',
+    'tickHandlers': 'emitTickers',
+    'realtimeHandlers': 'emitRealtimeBar',
+}
+"""Phase name -> SimClient method timed for it."""
+
+HandlerPhases = ('barHandlers', 'fillHandlers', 'tickHandlers', 'realtimeHandlers')
+
+
+class Profiler:
+    """
+    Times the replay phases of a SimClient.
+
+    :meth:`enable` shadows the client methods listed in ``Phases`` with timed
+    wrappers on the instance, :meth:`disable` removes them, so a client that
+    isn't profiled runs the plain methods. Phases nest (a fill's handlers
+    run inside its execution, inside the matching; tick and real-time bar
+    handlers inside ``ticks`` and ``realtime``): ``self`` excludes the
+    nested phases, ``total`` includes them, so strategy time is only ever
+    counted under the handler phases. ``replay`` is the wall time of
+    the run not spent in any phase: bar iteration, roll-ups and the clock.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.enabled = False
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.total: Dict[str, float] = defaultdict(float)
+        self.self: Dict[str, float] = defaultdict(float)
+        # [time in phases not nested in another one, then the nested time of each running phase]
+        self._nested: List[float] = [0.0]
+        self.reset()
+
+    def reset(self):
+        self.calls.clear()
+        self.total.clear()
+        self.self.clear()
+        self._nested[:] = [0.0]
+        self.startTime = 0.0
+        self.endTime = 0.0
+        self.startBars = 0
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for name, method in Phases.items():
+            setattr(self.client, method, self._timed(name, getattr(self.client, method)))
+        replayAsync = self.client.replayAsync
+
+        @functools.wraps(replayAsync)
+        async def timedReplay():
+            self.startTime = time.perf_counter()
+            self.startBars = self.client.barsReplayed
+            try:
+                await replayAsync()
+            finally:
+                self.endTime = time.perf_counter()
+        self.client.replayAsync = timedReplay
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for method in (*Phases.values(), 'replayAsync'):
+            self.client.__dict__.pop(method, None)
+
+    def _timed(self, name: str, fn: Callable) -> Callable:
+        nested = self._nested
+        calls, total, own = self.calls, self.total, self.self
+        perf_counter = time.perf_counter
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            nested.append(0.0)
+            t = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = perf_counter() - t
+                inner = nested.pop()
+                calls[name] += 1
+                total[name] += dt
+                own[name] += dt - inner
+                nested[-1] += dt
+        return timed
+
+    def report(self) -> dict:
+        """
+        Run summary: wall time, bars and events replayed and per-phase
+        ``calls``, ``total`` and ``self`` seconds with ``share`` of the wall time.
+        """
+        end = self.endTime or time.perf_counter()
+        wall = end - self.startTime if self.startTime else 0.0
+        bars = self.client.barsReplayed - self.startBars
+        replay = max(wall - self._nested[0], 0.0)
+        phases = {'replay': {'calls': bars, 'total': wall, 'self': replay}}
+        for name in Phases:
+            phases[name] = {'calls': self.calls[name], 'total': self.total[name], 'self': self.self[name]}
+        for phase in phases.values():
+            phase['share'] = phase['self'] / wall if wall else 0.0
+        return {
+            'wall': wall,
+            'bars': bars,
+            'barsPerSec': bars / wall if wall else 0.0,
+            'events': sum(self.calls[name] for name in HandlerPhases),
+            'phases': phases,
+        }
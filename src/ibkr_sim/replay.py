@@ -0,0 +1,104 @@
+"""Time-ordered replay of every subscribed contract."""
+
+import heapq
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ib_async.contract import Contract
+from ib_async.objects import BarData
+
+from ibkr_sim.bar_store import Row, SymbolBars, bucketStart
+from ibkr_sim.sim_clock import toDatetime, toTimestamp
+from ibkr_sim.ticks import IntrabarPaths, SubBars
+
+
+class RollUp:
+    """
+    Incremental roll-up of a feed's base bars into one coarser bar size.
+
+    Every base bar yields the bar in progress: a new bar when it starts a new
+    bucket, otherwise the current bar updated with it, like the partial bar
+    updates of a live ``keepUpToDate`` subscription.
+    """
+
+    def __init__(self, seconds: int, last: Optional[BarData] = None):
+        self.seconds = seconds
+        self.reqIds: List[int] = []
+        self.bar = last
+        self._start = int(toTimestamp(last.date)) if last is not None else None
+
+    def update(self, ts: int, o: float, h: float, l: float, c: float, v: float) -> BarData:
+        start = bucketStart(ts, self.seconds)
+        bar = self.bar
+        if bar is None or start != self._start:
+            count = bar.barCount + 1 if bar is not None else 0
+            self.bar = BarData(toDatetime(start), o, h, l, c, v, 0.0, count)
+            self._start = start
+        else:
+            self.bar = BarData(bar.date, bar.open, max(bar.high, h), min(bar.low, l), c,
+                               bar.volume + v, 0.0, bar.barCount)
+        return self.bar
+
+
+class Feed:
+    """
+    Replay cursor over one contract's bars and the subscriptions fed from it:
+    ``reqIds`` at the base bar size, ``rollUps`` per coarser size in seconds,
+    ``tickReqIds`` (reqId -> tick type) for the synthesized ticks and
+    ``realTimeReqIds`` for the 5 second real-time bars.
+    """
+
+    def __init__(self, contract: Contract, symbolBars: SymbolBars, start: int):
+        self.contract = contract
+        self.bars = symbolBars
+        self.start = start
+        self.cursor = start
+        self.reqIds: List[int] = []
+        self.rollUps: Dict[int, RollUp] = {}
+        self.tickReqIds: Dict[int, str] = {}
+        self.paths: Optional[IntrabarPaths] = None
+        self.realTimeReqIds: List[int] = []
+        self.subBars: Optional[SubBars] = None
+
+
+class Replay:
+    """
+    K-way heap merge over the per-symbol bar arrays.
+
+    Iterating yields ``(feed, row)`` in global timestamp order, ties broken
+    by the order the feeds were added. Feeds can be added while the merge
+    is running and join from their own start row.
+    """
+
+    def __init__(self):
+        self.feeds: Dict[str, Feed] = {}
+        self._heap: List[Tuple[int, int, Row, Feed, Iterator[Row]]] = []
+        self._seq = itertools.count()
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.feeds
+
+    def __getitem__(self, symbol: str) -> Feed:
+        return self.feeds[symbol]
+
+    def add(self, symbol: str, feed: Feed):
+        self.feeds[symbol] = feed
+        rows = feed.bars.rows(feed.start)
+        row = next(rows, None)
+        if row is not None:
+            heapq.heappush(self._heap, (row[1], next(self._seq), row, feed, rows))
+
+    def stop(self):
+        """Drop the rows left in every feed, the merge ends after the row being replayed."""
+        self._heap.clear()
+
+    def __iter__(self) -> Iterator[Tuple[Feed, Row]]:
+        heap = self._heap
+        while heap:
+            _, seq, row, feed, rows = heap[0]
+            nextRow = next(rows, None)
+            if nextRow is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (nextRow[1], seq, nextRow, feed, rows))
+            yield feed, row
@@ -0,0 +1,88 @@
+"""Publish bar arrays through shared memory so worker processes map them instead of copying."""
+
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+from ibkr_sim.bar_store import SymbolBars
+
+Columns = ('ts', 'open', 'high', 'low', 'close', 'volume')
+Spec = Dict[str, Tuple[str, int]]
+
+
+def _openBlock(name: str) -> shared_memory.SharedMemory:
+    try:
+        # attach without registering with the resource tracker, the publisher owns the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _view(block: shared_memory.SharedMemory, n: int) -> SymbolBars:
+    arrays = []
+    for k, column in enumerate(Columns):
+        dtype = np.int64 if column == 'ts' else np.float64
+        array = np.ndarray((n,), dtype=dtype, buffer=block.buf, offset=k * n * 8)
+        array.flags.writeable = False
+        arrays.append(array)
+    return SymbolBars(*arrays)
+
+
+class SharedBars:
+    """
+    One shared memory block per symbol holding its ts and OHLCV columns back to back.
+
+    The publishing process creates the blocks with :meth:`publish` and hands
+    :attr:`spec` (block names and lengths, cheap to pickle) to the workers,
+    which map read-only SymbolBars over the same pages with :meth:`attach`.
+    Only the publisher unlinks the blocks, on :meth:`close` or leaving the
+    ``with`` block.
+    """
+
+    def __init__(self, blocks: Dict[str, shared_memory.SharedMemory], spec: Spec, owner: bool):
+        self._blocks = blocks
+        self.spec = spec
+        self._owner = owner
+        self.bars: Dict[str, SymbolBars] = {
+            symbol: _view(blocks[symbol], n) for symbol, (_, n) in spec.items()}
+
+    @classmethod
+    def publish(cls, store: Dict[str, SymbolBars]) -> 'SharedBars':
+        """Copy every symbol of ``store`` into new shared memory blocks."""
+        blocks, spec = {}, {}
+        try:
+            for symbol, symbolBars in store.items():
+                n = len(symbolBars)
+                block = shared_memory.SharedMemory(create=True, size=max(len(Columns) * n * 8, 1))
+                blocks[symbol] = block
+                spec[symbol] = (block.name, n)
+                for k, column in enumerate(Columns):
+                    dtype = np.int64 if column == 'ts' else np.float64
+                    np.ndarray((n,), dtype=dtype, buffer=block.buf, offset=k * n * 8)[:] = getattr(symbolBars, column)
+        except BaseException:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+            raise
+        return cls(blocks, spec, owner=True)
+
+    @classmethod
+    def attach(cls, spec: Spec) -> 'SharedBars':
+        """Map the blocks published under ``spec``."""
+        return cls({symbol: _openBlock(name) for symbol, (name, _) in spec.items()}, spec, owner=False)
+
+    def close(self):
+        self.bars = {}
+        for block in self._blocks.values():
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks = {}
+
+    def __enter__(self) -> 'SharedBars':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -6,7 +6,7 @@ import dateutil
 import logging
 import time
 from collections import deque
-from typing import Deque, Awaitable, Dict, Iterator, List, Optional, Union, override
+from typing import Deque, Awaitable, Dict, Iterator, List, Optional, Tuple, Union, override
 
 import dateutil.parser
 from eventkit import Event
@@ -18,14 +18,45 @@ from ib_async.contract import (ComboLeg, Contract, ContractDescription, Contract
 from ib_async.order import BracketOrder, LimitOrder, Order, OrderState, OrderStatus, StopOrder, Trade
 from ib_async.objects import (
     BarDataList, BarData, CommissionReport, DepthMktDataDescription, Execution, FamilyCode,
-    HistogramData, HistoricalSession, HistoricalTick, HistoricalTickBidAsk,
+    Fill, HistogramData, HistoricalSession, HistoricalTick, HistoricalTickBidAsk,
     HistoricalTickLast, NewsProvider, PriceIncrement, Position, SmartComponent,
     SoftDollarTier, TagValue, TickAttribBidAsk, TickAttribLast, ConnectionStats, WshEventData)
 
+from ibkr_sim.account_state import AccountState
+from ibkr_sim.bar_lists import ArrayBarDataList
+from ibkr_sim.bar_store import BarStore, SymbolBars, barSizeSeconds
+from ibkr_sim.order_book import OrderBook
+from ibkr_sim.profiler import Profiler
+from ibkr_sim.replay import Feed, Replay, RollUp
+from ibkr_sim.snapshot import Snapshot, WrapperState
+from ibkr_sim.ticks import IntrabarPaths, SubBars
+from ibkr_sim.sim_clock import SimClock, durationDelta, durationStart, toDatetime, toTimestamp
+
+
+def apply_fill(position: float, avgCost: float, qty: float, price: float, multiplier: float) -> Tuple[float, float, float]:
+    """
+    Position, average cost and realized PnL after filling the signed ``qty`` at ``price``.
+    Covers open, add, reduce, close and reverse with average-cost accounting.
+    """
+    newPosition = position + qty
+    if qty == 0:
+        return position, avgCost, 0.0
+    if position == 0 or position * qty > 0:
+        # Open or add to existing position
+        return newPosition, (position * avgCost + qty * price) / newPosition, 0.0
+    closed = min(abs(qty), abs(position))
+    realizedPNL = closed * (price - avgCost) * multiplier * (1 if position > 0 else -1)
+    if newPosition * position > 0:
+        # Reducing existing position
+        return newPosition, avgCost, realizedPNL
+    # Close or reverse existing position
+    return newPosition, price, realizedPNL
+
 
 class SimClient(Client):
     
-    def __init__(self, wrapper, ContractData, AccountBalance) :
+    def __init__(self, wrapper, ContractData, AccountBalance, FastForward=True,
+                 AccountUpdateBars=1, AccountUpdateSeconds=0) :
         super(SimClient, self).__init__(wrapper)  
         self.decoder = None
         self.conn = None
@@ -35,24 +66,44 @@ class SimClient(Client):
         self._permIdSeq = 1
         self._execIdSeq = 1
         self._accounts = ["SimAccount",]
-        self.TotalCashBalance = AccountBalance
         self._contractData = ContractData
+        self._store = BarStore(ContractData)
+        self._replay = Replay()
+        self._replayTask: Optional[asyncio.Task] = None
+        self.account = AccountState(wrapper, self._accounts[0], AccountBalance,
+                                    AccountUpdateBars, AccountUpdateSeconds)
+        self.orderBook = OrderBook()
         self._position = 0
-        # FIXME: Need to cater for differnet Contract Classes 
-        # should not be hard-coded
-        self.commission = 3.5
+        self.clock = SimClock(fastForward=FastForward)
+        self.profiler = Profiler(self)
+
+    # FIXME: Need to cater for differnet Contract Classes 
+    # should not be hard-coded
+    commission = 3.5
+
+    @property
+    def TotalCashBalance(self) -> float:
+        return self.account.cash
         
 
+    @property
+    def barsReplayed(self) -> int:
+        return sum(feed.cursor - feed.start for feed in self._replay.feeds.values())
+
     @override
     def connectionStats(self) -> ConnectionStats:
-        """Get statistics about the connection."""
+        """
+        Statistics of the simulated connection: the bars replayed and
+        executions sent count as messages received, the request and order
+        ids used as messages sent. Nothing goes over a wire, so no bytes.
+        """
         if not self.isReady():
             raise ConnectionError('Not connected')
         return ConnectionStats(
             self._startTime,
             time.time() - self._startTime,
-            self._numBytesRecv, 1,
-            self._numMsgRecv, 1)
+            0, 0,
+            self.barsReplayed + self._execIdSeq - 1, self._reqIdSeq)
 
     @override
     async def connectAsync(self, host, port, clientId, timeout=2.0):
@@ -94,32 +145,33 @@ class SimClient(Client):
         except Exception as e: 
             logging.exception("\n\tSimulated Environment\n\tRequested function not implemented\n\tImplement function!!!\nterminating",stack_info=True,stacklevel=2)
         finally:
-            util.getLoop().stop()
+            # end this client's replay, other clients on the loop keep running
+            self.stopReplay()
             
 
-    # def reqMktData(
-    #         self, reqId, contract, genericTickList, snapshot,
-    #         regulatorySnapshot, mktDataOptions):
-    #     fields = [1, 11, reqId, contract]
-
-    #     if contract.secType == 'BAG':
-    #         legs = contract.comboLegs or []
-    #         fields += [len(legs)]
-    #         for leg in legs:
-    #             fields += [leg.conId, leg.ratio, leg.action, leg.exchange]
-
-    #     dnc = contract.deltaNeutralContract
-    #     if dnc:
-    #         fields += [True, dnc.conId, dnc.delta, dnc.price]
-    #     else:
-    #         fields += [False]
+    @override
+    def reqMktData(
+            self, reqId, contract, genericTickList, snapshot,
+            regulatorySnapshot, mktDataOptions):
+        if snapshot or regulatorySnapshot:
+            symbolBars = self._store[contract.symbol]
+            end = int(symbolBars.ts.searchsorted(self.clock.now, side='right'))
+            if end:
+                price = float(symbolBars.close[end - 1])
+                for tickType in (1, 2, 4):
+                    self.wrapper.priceSizeTick(reqId, tickType, price, 0.0)
+            self.wrapper.tickSnapshotEnd(reqId)
+            return
+        feed = self.subscribe(contract)
+        feed.tickReqIds[reqId] = "mktData"
 
-    #     fields += [
-    #         genericTickList, snapshot, regulatorySnapshot, mktDataOptions]
-    #     self.send(*fields)
+    @override
+    def cancelMktData(self, reqId):
+        self._cancelTicks(reqId)
 
-    # def cancelMktData(self, reqId):
-    #     self.send(2, 2, reqId)
+    def _cancelTicks(self, reqId):
+        for feed in self._replay.feeds.values():
+            feed.tickReqIds.pop(reqId, None)
 
     @override
     def placeOrder(self, orderId, contract:Contract, order: Order):
@@ -196,49 +248,258 @@ class SimClient(Client):
 
     # def replaceFA(self, reqId, faData, cxml):
     #     self.send(19, 1, faData, cxml, reqId)
-    async def historicalDataUpdateAsync(self, reqId: int):
-        for index, row in self._df.iterrows():
-            await asyncio.sleep(0.00001)
-            bar = BarData(
-                    date=str(row.date),
-                    open=float(row.open),
-                    high=float(row.high),
-                    low=float(row.low),
-                    close=float(row.close),
-                    volume=float(row.volume),
-                    average=float(0),
-                    barCount=int(index)
-                )
-            self.wrapper.lastTime = row.date
-            self.wrapper.historicalDataUpdate(reqId, bar)
-        util.getLoop().stop()
+    async def replayAsync(self):
+        """Single replay driver: emits the bars of every subscribed contract in time order."""
+        clock = self.clock
+        await clock.released()
+        for feed, (i, ts, o, h, l, c, v) in self._replay:
+            if clock.advance(ts):
+                await clock.catchUp(ts)
+            bar = BarData(toDatetime(ts), o, h, l, c, v, 0.0, i)
+            feed.cursor = i + 1
+            # ticks of a bar at the same time may have moved the clock past it, time doesn't go back
+            self.wrapper.lastTime = bar.date if ts >= clock.now else clock.datetime
+            if feed.tickReqIds:
+                self.replay_ticks(feed, i, ts)
+            if feed.realTimeReqIds:
+                self.replay_realtime(feed, i, ts, match=not feed.tickReqIds)
+            if not (feed.tickReqIds or feed.realTimeReqIds):
+                self.update_executions(feed.contract, o, h, l, c)
+            for reqId in feed.reqIds:
+                self.historicalDataUpdate(reqId, bar)
+            for rollUp in feed.rollUps.values():
+                rolled = rollUp.update(ts, o, h, l, c, v)
+                for reqId in rollUp.reqIds:
+                    self.historicalDataUpdate(reqId, rolled)
+        clock.stop()
+        self.wrapper.ib.replayEndEvent.emit(self.wrapper.ib)
+
+    def stopReplay(self):
+        """End the replay after the bar being replayed, as if the data ran out."""
+        self._replay.stop()
+
+    def subscribe(self, contract: Contract, start: int = None) -> Feed:
+        """
+        Feed of the contract in the replay, added from row ``start`` (default:
+        the clock) if the contract isn't replayed yet, and the replay started.
+        """
+        feed = self._replay.feeds.get(contract.symbol)
+        if feed is None:
+            symbolBars = self._store[contract.symbol]
+            if start is None:
+                start = int(symbolBars.ts.searchsorted(self.clock.now, side='right')) if self.clock.now else 0
+            cd = self._contractData[contract.symbol]['ContractDetails']
+            feed = Feed(cd.contract, symbolBars, start)
+            self._replay.add(contract.symbol, feed)
+        self.clock.start()
+        if self._replayTask is None or self._replayTask.done():
+            self._replayTask = util.getLoop().create_task(self.replayAsync())
+        return feed
+
+    def snapshot(self, state=None) -> Snapshot:
+        """
+        Simulator state as of now, see :class:`Snapshot`. Taken from a bar
+        handler the replay resumes with the next bar; ``state`` is the
+        strategy's own and must be picklable.
+        """
+        feeds = [{'symbol': symbol, 'cursor': feed.cursor, 'reqIds': feed.reqIds, 'rollUps': feed.rollUps,
+                  'tickReqIds': feed.tickReqIds, 'realTimeReqIds': feed.realTimeReqIds}
+                 for symbol, feed in self._replay.feeds.items()]
+        return Snapshot.take(
+            self.clock.now, self.barsReplayed,
+            feeds=feeds,
+            wrapper={name: getattr(self.wrapper, name) for name in WrapperState},
+            orderBook=self.orderBook,
+            account=self.account,
+            sequences=(self._reqIdSeq, self._permIdSeq, self._execIdSeq),
+            state=state)
+
+    def restore(self, snapshot: Snapshot):
+        """
+        Take over the state of ``snapshot`` and subscribe its feeds from
+        their cursors, before anything was requested or replayed. Returns
+        the strategy state.
+        """
+        if self._replay.feeds:
+            raise RuntimeError('restore needs a client that has not replayed anything yet')
+        saved = snapshot.restore()
+        for name, value in saved['wrapper'].items():
+            setattr(self.wrapper, name, value)
+        for bars in self.wrapper.reqId2Subscriber.values():
+            if isinstance(bars, ArrayBarDataList):
+                bars.bars = self._store[bars.contract.symbol]
+        self.orderBook = saved['orderBook']
+        account = saved['account']
+        # the update interval is this client's, not the snapshot's
+        account.everyBars, account.everySeconds = self.account.everyBars, self.account.everySeconds
+        account.wrapper = self.wrapper
+        self.account = account
+        self._reqIdSeq, self._permIdSeq, self._execIdSeq = saved['sequences']
+        self.clock.now = snapshot.time
+        for f in saved['feeds']:
+            cd = self._contractData[f['symbol']]['ContractDetails']
+            feed = self.subscribe(cd.contract, f['cursor'])
+            feed.reqIds = f['reqIds']
+            feed.rollUps = f['rollUps']
+            feed.tickReqIds = f['tickReqIds']
+            feed.realTimeReqIds = f['realTimeReqIds']
+        return saved['state']
+
+    def replay_ticks(self, feed: Feed, i: int, ts: int):
+        """
+        Replay bar ``i`` as its synthesized ticks. Resting orders are matched
+        along each leg of the path before the tick ending it is sent, so
+        intrabar LMT and STP fills happen in path order and an order placed
+        from a tick callback fills on the next leg. The clock and ``lastTime``
+        follow the ticks and stay at the last one for the bar's own update.
+        """
+        if feed.paths is None:
+            feed.paths = IntrabarPaths(feed.bars)
+        prices, sizes = feed.paths.path(i)
+        conId = feed.contract.conId
+        wrapper = self.wrapper
+        clock = self.clock
+        prev = prices[0]
+        for offset, price, size in zip(feed.paths.offsets, prices, sizes):
+            wrapper.tcpDataArrived()
+            t = ts + offset
+            clock.moveTo(t)
+            wrapper.lastTime = toDatetime(t)
+            self.account.mark(conId, price)
+            self.match_orders(conId, prev, max(prev, price), min(prev, price), price)
+            for reqId, tickType in list(feed.tickReqIds.items()):
+                match tickType:
+                    case "mktData":
+                        # zero spread: bid and ask at the traded price
+                        wrapper.priceSizeTick(reqId, 1, price, size)
+                        wrapper.priceSizeTick(reqId, 2, price, size)
+                        wrapper.priceSizeTick(reqId, 4, price, size)
+                    case "Last" | "AllLast":
+                        wrapper.tickByTickAllLast(reqId, 1 if tickType == "Last" else 2, int(t), price, size,
+                                                  TickAttribLast(), feed.contract.exchange, '')
+                    case "BidAsk":
+                        wrapper.tickByTickBidAsk(reqId, int(t), price, price, size, size, TickAttribBidAsk())
+                    case "MidPoint":
+                        wrapper.tickByTickMidPoint(reqId, int(t), price)
+            self.emitTickers()
+            prev = price
+        self.do_updateportfolio()
+
+    def replay_realtime(self, feed: Feed, i: int, ts: int, match: bool = True):
+        """
+        Send the 5 second sub-bars of bar ``i`` to the real-time bar
+        subscriptions. With ``match`` resting orders are matched per sub-bar,
+        so an order placed from a ``realtimeBar`` callback fills on the next
+        sub-bar; otherwise the ticks of the bar already did the matching.
+        """
+        if feed.subBars is None:
+            feed.subBars = SubBars(feed.bars)
+        conId = feed.contract.conId
+        wrapper = self.wrapper
+        clock = self.clock
+        for offset, o, h, l, c, v, wap in feed.subBars.subBars(i):
+            t = ts + offset
+            clock.moveTo(t)
+            wrapper.lastTime = toDatetime(t)
+            if match:
+                self.account.mark(conId, c)
+                self.match_orders(conId, o, h, l, c)
+            for reqId in feed.realTimeReqIds:
+                self.emitRealtimeBar(reqId, t, o, h, l, c, v, wap)
+        if match:
+            self.do_updateportfolio()
+
+    def historicalDataUpdate(self, reqId: int, bar: BarData):
+        """Same as Wrapper.historicalDataUpdate but for bars that already carry a datetime."""
+        bars = self.wrapper.reqId2Subscriber.get(reqId)
+        if bars is None:
+            return
+        if type(bars) is ArrayBarDataList:
+            # base bars come from the arrays the list is backed by
+            bars.advance(bar.barCount + 1)
+            self.emitBarUpdate(bars, True)
+            return
+        hasNewBar = not bars or bar.date > bars[-1].date
+        if hasNewBar:
+            bars.append(bar)
+        elif bar.date < bars[-1].date:
+            return
+        elif bars[-1] != bar:
+            bars[-1] = bar
+        else:
+            return
+        self.emitBarUpdate(bars, hasNewBar)
+
+    def emitBarUpdate(self, bars, hasNewBar: bool):
+        self.wrapper.ib.barUpdateEvent.emit(bars, hasNewBar)
+        bars.updateEvent.emit(bars, hasNewBar)
+
+    def emitCommissionReport(self, trade: Trade, fill: Fill, report: CommissionReport):
+        self.wrapper.ib.commissionReportEvent.emit(trade, fill, report)
+
+    def emitTickers(self):
+        """Send the updated tickers to their handlers, once per tick."""
+        self.wrapper.tcpDataProcessed()
+
+    def emitRealtimeBar(self, reqId: int, t: int, o: float, h: float, l: float, c: float, v: float, wap: float):
+        self.wrapper.realtimeBar(reqId, t, o, h, l, c, v, wap, 0)
 
     @override
     def reqHistoricalData(
             self, reqId, contract, endDateTime, durationStr, barSizeSetting,
             whatToShow, useRTH, formatDate, keepUpToDate, chartOptions):
-        _df = self._contractData[contract.symbol]['df']
-        # FIXME: Should not be hard coded but based on max strategy bars needed
-        n=100
-        for index, row in _df[:n].iterrows():
-            bar = BarData(
-                date=str(row.date),
-                open=float(row.open),
-                high=float(row.high),
-                low=float(row.low),
-                close=float(row.close),
-                volume=float(row.volume),
-                average=float(0),
-                barCount=int(index))                  
-            self.wrapper.historicalData(int(reqId), bar)
-            self.wrapper.lastTime = bar.date
+        symbolBars = self._store[contract.symbol]
+        seconds = barSizeSeconds(barSizeSetting)
+        aggregate = self._store.aggregate(contract.symbol, seconds)
+        if aggregate is None and seconds < symbolBars.barSize:
+            self._logger.warning(f'{contract.symbol}: barSizeSetting {barSizeSetting} is finer than the data, using the base bars')
+        # the window is the bars in [windowEnd - durationStr, windowEnd)
+        ts = symbolBars.ts
+        feed = self._replay[contract.symbol] if contract.symbol in self._replay else None
+        if feed is not None:
+            # join the running feed so all subscriptions stay aligned
+            end = feed.cursor
+            windowEnd = self.clock.now + 1
+        elif endDateTime:
+            # also where a keepUpToDate replay starts
+            windowEnd = toTimestamp(endDateTime)
+            end = int(ts.searchsorted(windowEnd, side='left'))
+        elif self.clock.now:
+            windowEnd = self.clock.now + 1
+            end = int(ts.searchsorted(windowEnd, side='left'))
+        else:
+            # nothing replayed yet: the first durationStr of data is the warmup
+            windowEnd = toTimestamp(toDatetime(int(ts[0])) + durationDelta(durationStr)) if len(ts) else 0
+            end = int(ts.searchsorted(windowEnd, side='left'))
+        start = min(int(ts.searchsorted(durationStart(windowEnd, durationStr), side='left')), end)
+        results = self.wrapper._results.get(reqId)
+        if isinstance(results, ArrayBarDataList):
+            if aggregate is not None:
+                raise ValueError(f'{contract.symbol}: array-backed bars need the bar size of the data')
+            warmup = None
+            results.attach(symbolBars, start, end)
+        elif aggregate is None:
+            maxBars = getattr(results, 'maxBars', 0)
+            if maxBars:
+                # a bounded list would drop the older bars straight away
+                start = max(start, end - maxBars)
+            warmup = symbolBars.barList(start, end)
+        else:
+            warmup = aggregate.barList(start, end)
+        if results is not None and warmup is not None:
+            results.extend(warmup)
+        if end:
+            self.wrapper.lastTime = toDatetime(int(ts[end - 1]))
+            self.clock.advance(int(ts[end - 1]))
 
-        
-        self._df = _df[n:]
-        self.wrapper.ib.barUpdateEvent += self.update_executions
         if keepUpToDate:
-            loop = util.getLoop()
-            loop.create_task(self.historicalDataUpdateAsync(reqId))
+            feed = self.subscribe(contract, end)
+            if aggregate is None:
+                feed.reqIds.append(reqId)
+            else:
+                if seconds not in feed.rollUps:
+                    feed.rollUps[seconds] = RollUp(seconds, warmup[-1] if warmup else None)
+                feed.rollUps[seconds].reqIds.append(reqId)
 
         self.wrapper.historicalDataEnd(int(reqId), None, None)
 
@@ -300,18 +561,26 @@ class SimClient(Client):
     # def cancelHistoricalData(self, reqId):
     #     self.send(25, 1, reqId)
 
-    # def reqCurrentTime(self):
-    #     self.send(49, 1)
+    @override
+    def reqCurrentTime(self):
+        self.wrapper.currentTime(int(self.clock.now))
 
-    # def reqRealTimeBars(
-    #         self, reqId, contract, barSize, whatToShow,
-    #         useRTH, realTimeBarsOptions):
-    #     self.send(
-    #         50, 3, reqId, contract, barSize, whatToShow,
-    #         useRTH, realTimeBarsOptions)
+    @override
+    def reqRealTimeBars(
+            self, reqId, contract, barSize, whatToShow,
+            useRTH, realTimeBarsOptions):
+        symbolBars = self._store[contract.symbol]
+        if symbolBars.barSize < 5:
+            self._logger.warning(
+                f'{contract.symbol}: data is {symbolBars.barSize} secs, real-time bars are sent at that size')
+        feed = self.subscribe(contract)
+        feed.realTimeReqIds.append(reqId)
 
-    # def cancelRealTimeBars(self, reqId):
-    #     self.send(51, 1, reqId)
+    @override
+    def cancelRealTimeBars(self, reqId):
+        for feed in self._replay.feeds.values():
+            if reqId in feed.realTimeReqIds:
+                feed.realTimeReqIds.remove(reqId)
 
     # def reqFundamentalData(
     #         self, reqId, contract, reportType, fundamentalDataOptions):
@@ -402,6 +671,7 @@ class SimClient(Client):
 
     @override
     def reqAccountUpdatesMulti(self, reqId, account, modelCode, ledgerAndNLV):
+        self.account.flush()
         self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='AccountCode', val=self._accounts[0], currency='', modelCode='')
         self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='AccountOrGroup', val=self._accounts[0], currency='BASE', modelCode='')
         self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='AccountReady', val='true', currency='', modelCode='')
@@ -412,8 +682,8 @@ class SimClient(Client):
         self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='MaintMarginReq', val='0', currency='AUD', modelCode='')
 
         self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='TotalCashBalance', val=f'{self.TotalCashBalance:.2f}', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='UnrealizedPnL', val='0', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='RealizedPnL', val='0', currency='BASE', modelCode='')
+        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='UnrealizedPnL', val=f'{self.account.unrealizedPnL}', currency='BASE', modelCode='')
+        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='RealizedPnL', val=f'{self.account.realizedPnL}', currency='BASE', modelCode='')
 
         self.wrapper.accountUpdateMultiEnd(reqId) 
 
@@ -496,12 +766,16 @@ class SimClient(Client):
     #         startDateTime, endDateTime, numberOfTicks, whatToShow,
     #         useRth, ignoreSize, miscOptions)
 
-    # def reqTickByTickData(
-    #         self, reqId, contract, tickType, numberOfTicks, ignoreSize):
-    #     self.send(97, reqId, contract, tickType, numberOfTicks, ignoreSize)
+    @override
+    def reqTickByTickData(
+            self, reqId, contract, tickType, numberOfTicks, ignoreSize):
+        # FIXME: numberOfTicks of history before the stream are not sent
+        feed = self.subscribe(contract)
+        feed.tickReqIds[reqId] = tickType
 
-    # def cancelTickByTickData(self, reqId):
-    #     self.send(98, reqId)
+    @override
+    def cancelTickByTickData(self, reqId):
+        self._cancelTicks(reqId)
 
     @override
     def reqCompletedOrders(self, apiOnly):
@@ -555,72 +829,17 @@ class SimClient(Client):
         self._execIdSeq += 1
         return newId
 
-    def do_updateportfolio(self, price: float):
-        dailyPnL = 0.0
-        realizedPNL = 0.0
-        unrealizedPNL = 0.0
-        marketValue = 0.0
-        # Get Current Position if exists
-        positions = self.wrapper.positions[self._accounts[0]]
-        for key in positions:
-            curPos = positions[key]
-            if curPos:
-                unrealizedPNL += abs(curPos.position) * (price - curPos.avgCost) * curPos.contract.multiplier
-                realizedPNL += 0.0
-                marketValue += abs(curPos.position * price * curPos.contract.multiplier)
-                self.wrapper.updatePortfolio(curPos.contract, abs(curPos.position), 
-                        price , marketValue, curPos.avgCost,
-                        unrealizedPNL, realizedPNL, self._accounts[0])
-        
-        reqId = self.getReqId()
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='TotalCashBalance', val=f'{self.TotalCashBalance:.2f}', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='UnrealizedPnL', val=f'{unrealizedPNL}', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='RealizedPnL', val=f'{realizedPNL}', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMultiEnd(reqId) 
-        
+    def do_updateportfolio(self):
+        self.account.newBar(self.clock.now)
 
     def do_execution(self, trade, price):        
-        realizedPNL = 0.0
-        newAvgPrice = 0.0
-
         side = -1 if trade.order.action == "SELL" else 1
 
         positions = self.wrapper.positions[self._accounts[0]]
         current_position = positions.get(trade.contract.conId) or Position(self._accounts[0], trade.contract, 0, 0.0)
-        new_position_size = side * trade.order.totalQuantity 
-        newAvgPrice = price
-
-        if current_position.position == 0:
-           pass      
-        else:
-            # Close existing trade
-            if new_position_size == -current_position.position: 
-                if trade.order.action == "SELL":
-                    realizedPNL = trade.order.totalQuantity * (price - current_position.avgCost) * trade.contract.multiplier 
-                else:
-                    realizedPNL = trade.order.totalQuantity * (current_position.avgCost - price) * trade.contract.multiplier 
-                new_position_size = 0 
-            # Add to existing position
-            elif new_position_size + current_position.position > 0 and new_position_size * current_position.position > 0: 
-                newAvgPrice = (trade.orderStatus.filled * trade.orderStatus.avgFillPrice + current_position.avgCost * current_position.position) / (trade.orderStatus.filled  + current_position.position)
-                new_position_size = new_position_size + current_position.position
-            # Reducing to existing position
-            elif abs(new_position_size) < abs(current_position.position) and new_position_size * current_position.position < 0:
-                if trade.order.action == "SELL":
-                    realizedPNL = trade.order.totalQuantity * (price - current_position.avgCost) * trade.contract.multiplier 
-                else:
-                    realizedPNL = trade.order.totalQuantity * (current_position.avgCost - price) * trade.contract.multiplier 
-                newAvgPrice = current_position.avgCost
-                new_position_size = new_position_size + current_position.position         
-            # Reverse existing position
-            elif abs(new_position_size) > abs(current_position.position) and new_position_size * current_position.position < 0:
-                if trade.order.action == "SELL":
-                    realizedPNL = abs(current_position.position) * (price - current_position.avgCost) * trade.contract.multiplier 
-                else:
-                    realizedPNL = abs(current_position.position) * (current_position.avgCost - price) * trade.contract.multiplier 
-                newAvgPrice = price
-                new_position_size = new_position_size + current_position.position
-                 
+        new_position_size, newAvgPrice, realizedPNL = apply_fill(
+            current_position.position, current_position.avgCost,
+            side * trade.order.totalQuantity, price, float(trade.contract.multiplier))
 
         self.wrapper.orderStatus(
                         orderId=trade.order.orderId, 
@@ -677,38 +896,45 @@ class SimClient(Client):
         self.wrapper.positionEnd()
         
 
-        self.TotalCashBalance += realizedPNL - comm.commission
-        self.wrapper.accountUpdateMulti(reqId=reqId, account=self._accounts[0], tag='TotalCashBalance', val=f'{self.TotalCashBalance:.2f}', currency='BASE', modelCode='')
-        self.wrapper.accountUpdateMultiEnd(reqId) 
-        self.wrapper.ib.commissionReportEvent.emit(trade, fill, report)
+        self.account.fill(trade.contract, realizedPNL, comm.commission)
+        self.emitCommissionReport(trade, fill, report)
 
         # self._logger.info(f"executed: {self.wrapper.lastTime} \t{"SLD" if trade.order.action == "SELL" else "BOT"} {trade.order.totalQuantity}@{trade.orderStatus.avgFillPrice:.2f}  Position={newPos}")
 
 
 
-    def update_executions(self, bars: BarDataList, hasNewBar:bool):
-        trades = [v for v in self.wrapper.trades.values() if v.orderStatus.status == OrderStatus.Submitted and v.orderStatus.status not in OrderStatus.DoneStates]
-        for trade in trades:
-            match trade.order.action:
-                case "BUY":
-                    match trade.order.orderType:
-                        case "MKT":
-                            self.do_execution(trade, bars[-1].open)
-                        case "LMT":
-                            if trade.order.lmtPrice <= bars[-1].high:
-                                self.do_execution(trade, trade.order.lmtPrice)
-                        case "STP LMT":
-                            if trade.order.auxLmtPrice <= bars[-1].high:
-                                self.do_execution(trade, trade.order.auxLmtPrice)
-                case "SELL":
-                    match trade.order.orderType:
-                        case "MKT":
-                            self.do_execution(trade, bars[-1].open)
-                        case "LMT":
-                            if trade.order.lmtPrice >= bars[-1].low:
-                                self.do_execution(trade, trade.order.lmtPrice)
-                        case "STP LMT":
-                            if trade.order.auxLmtPrice >= bars[-1].low:
-                                self.do_execution(trade, trade.order.auxLmtPrice)
-
-        self.do_updateportfolio(bars[-1].close)
+    def do_orderStatus(self, trade: Trade, status: str):
+        """Report a status change of an unfilled order."""
+        self.wrapper.orderStatus(
+            orderId=trade.order.orderId,
+            status=status,
+            filled=0.0,
+            remaining=trade.order.totalQuantity,
+            avgFillPrice=0.0,
+            permId=trade.order.permId,
+            parentId=trade.order.parentId,
+            lastFillPrice=0.0,
+            clientId=self.wrapper.clientId,
+            whyHeld='',
+            mktCapPrice=0.0
+        )
+
+    def match_orders(self, conId: int, open_: float, high: float, low: float, close: float):
+        """Fill the orders of the contract triggered over a price path segment and report the orders it released or cancelled."""
+        book = self.orderBook
+        for trade, price in book.match(conId, open_, high, low, close):
+            if any(child is trade for child in book.activated):
+                # a child filled in the bar that released it is submitted first
+                book.activated = [child for child in book.activated if child is not trade]
+                self.do_orderStatus(trade, OrderStatus.Submitted)
+            self.do_execution(trade, price)
+        while book.activated:
+            self.do_orderStatus(book.activated.pop(0), OrderStatus.Submitted)
+        while book.cancelled:
+            self.do_orderStatus(book.cancelled.pop(0), OrderStatus.Cancelled)
+
+    def update_executions(self, contract: Contract, open_: float, high: float, low: float, close: float):
+        self.account.mark(contract.conId, close)
+        self.match_orders(contract.conId, open_, high, low, close)
+
+        self.do_updateportfolio()
@@ -0,0 +1,172 @@
+"""Virtual clock for the simulated replay."""
+
+import asyncio
+import heapq
+import itertools
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple, Union
+
+import dateutil.parser
+from dateutil.relativedelta import relativedelta
+from ib_async import util
+
+EPOCH = datetime(1970, 1, 1)
+
+Time_t = Union[datetime, date, str, int, float]
+
+
+def toTimestamp(t: Time_t) -> float:
+    """Convert a datetime, date string or epoch number to epoch seconds. Naive times are taken as UTC."""
+    if isinstance(t, (int, float)):
+        return float(t)
+    if isinstance(t, str):
+        t = dateutil.parser.parse(t.replace(' UTC', ''))
+    if not isinstance(t, datetime):
+        t = datetime(t.year, t.month, t.day)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+def toDatetime(ts: float) -> datetime:
+    """Convert epoch seconds to a naive UTC datetime, the form the replayed bars use."""
+    return EPOCH + timedelta(seconds=ts)
+
+
+_durationUnits = {
+    'S': lambda n: relativedelta(seconds=n),
+    'D': lambda n: relativedelta(days=n),
+    'W': lambda n: relativedelta(weeks=n),
+    'M': lambda n: relativedelta(months=n),
+    'Y': lambda n: relativedelta(years=n),
+}
+
+
+def durationDelta(durationStr: str) -> relativedelta:
+    """Length of an IB ``durationStr`` such as '30 D' or '1 M'."""
+    try:
+        count, unit = durationStr.split()
+        return _durationUnits[unit.upper()](int(count))
+    except (ValueError, KeyError):
+        raise ValueError(f'Unsupported durationStr {durationStr!r}')
+
+
+def durationStart(end: float, durationStr: str) -> float:
+    """Epoch seconds ``durationStr`` before ``end``."""
+    return toTimestamp(toDatetime(end) - durationDelta(durationStr))
+
+
+class SimClock:
+    """
+    Simulated time owned by SimClient and advanced by the replay.
+
+    The replay holds until ``release()`` is called, which IBSim does once the
+    strategy hands control over via ``run``/``sleep``/``waitUntil``, so no bar
+    is emitted before the strategy has attached its handlers.
+
+    In fast-forward mode the replay never sleeps on a timer: it only yields
+    to the event loop when a task sleeping on simulated time is due, or every
+    ``yieldInterval`` bars so other tasks keep running. Otherwise every bar
+    is paced with ``asyncio.sleep(delay)`` as before. A bar stamped exactly at
+    a sleeper's deadline is delivered before the sleeper wakes.
+    """
+
+    yieldInterval = 1000
+
+    def __init__(self, fastForward: bool = True, delay: float = 0.00001):
+        self.fastForward = fastForward
+        self.delay = delay
+        self.now = 0.0
+        self.running = False
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._steps = 0
+        self._released = asyncio.Event()
+
+    @property
+    def datetime(self) -> datetime:
+        return toDatetime(self.now)
+
+    def start(self):
+        """Mark the replay as active so sleepers wait for it to advance the clock."""
+        self.running = True
+
+    def release(self):
+        """Let the replay start advancing the clock."""
+        self._released.set()
+
+    async def released(self):
+        await self._released.wait()
+
+    def stop(self):
+        """Replay finished: release every sleeper, the clock cannot advance any further."""
+        self.running = False
+        while self._waiters:
+            deadline, _, future = heapq.heappop(self._waiters)
+            self.now = max(self.now, deadline)
+            if not future.done():
+                future.set_result(True)
+
+    def advance(self, ts: float) -> bool:
+        """
+        Move the clock forward to ``ts``. Returns True when the replay has to
+        ``await catchUp(ts)`` before emitting the bar: sleepers are due, the
+        replay is paced or it is time to yield to the loop.
+        """
+        if not self.fastForward or (self._waiters and self._waiters[0][0] < ts):
+            return True
+        self._steps += 1
+        if self._steps % self.yieldInterval == 0:
+            return True
+        if ts > self.now:
+            self.now = ts
+        return False
+
+    def moveTo(self, ts: float):
+        """
+        Move the clock forward to ``ts`` within a bar, as its ticks are sent,
+        so handlers sleep from the tick's time. Sleepers due by then wake
+        before the next bar.
+        """
+        if ts > self.now:
+            self.now = ts
+
+    async def catchUp(self, ts: float):
+        """Wake the sleepers due before ``ts`` at their own deadline, then hand control to the loop."""
+        waiters = self._waiters
+        while waiters and waiters[0][0] < ts:
+            deadline = waiters[0][0]
+            self.now = max(self.now, deadline)
+            while waiters and waiters[0][0] <= deadline:
+                _, _, future = heapq.heappop(waiters)
+                if not future.done():
+                    future.set_result(True)
+            await self.pause()
+        await self.pause()
+        if ts > self.now:
+            self.now = ts
+
+    async def pause(self):
+        """Hand control to the event loop between bars."""
+        await asyncio.sleep(0 if self.fastForward else self.delay)
+        # second pass so that woken sleepers, and a run_until_complete
+        # waiting on one of them, act before the next bar is emitted
+        await asyncio.sleep(0)
+
+    def sleepAsync(self, secs: float) -> asyncio.Future:
+        """Future that completes once simulated time has moved ``secs`` seconds on."""
+        return self.waitUntilAsync(self.now + max(secs, 0))
+
+    def waitUntilAsync(self, t: Time_t) -> asyncio.Future:
+        """Future that completes once simulated time reaches ``t``."""
+        deadline = toTimestamp(t)
+        future = util.getLoop().create_future()
+        if deadline <= self.now:
+            future.set_result(True)
+        elif not self.running:
+            # nothing drives the clock, jump straight to the deadline
+            self.now = deadline
+            future.set_result(True)
+        else:
+            heapq.heappush(self._waiters, (deadline, next(self._seq), future))
+        return future
@@ -1,25 +1,189 @@
 
-from ib_async import IB
+import asyncio
+
+from eventkit import Event
+
+from ib_async import IB, util
+from ib_async.objects import BarDataList
 from ib_async.order import BracketOrder, LimitOrder, Order, OrderState, OrderStatus, StopOrder, Trade
 
+from ibkr_sim.bar_lists import ArrayBarDataList, BoundedBarDataList
 from ibkr_sim.sim_client import SimClient
+from ibkr_sim.snapshot import Snapshot
 
 
 class IBSim(IB):
-    def __init__(self, ContractData, AccountBalance=100_000.00):
+    """
+    IB running against a replay of ``ContractData`` instead of a connection.
+
+    Each instance has its own client, clock and replay, and the end of its
+    replay is signalled per instance rather than by stopping the event loop:
+    ``replayEndEvent`` is emitted and :meth:`runAsync` returns. Any number of
+    instances can so run concurrently on one loop, with the async API::
+
+        async def backtest(ib):
+            await ib.connectAsync('127.0.0.1', 7497, clientId=1)
+            bars = await ib.reqHistoricalDataAsync(contract, '', '30 D', '5 mins', 'TRADES', False, keepUpToDate=True)
+            bars.updateEvent += onBarUpdate
+            await ib.runAsync()
+
+        await asyncio.gather(*(backtest(IBSim(ContractData)) for _ in range(20)))
+
+    Account values and portfolio items are sent every ``AccountUpdateBars``
+    bars or ``AccountUpdateSeconds`` simulated seconds, see :class:`AccountState`.
+
+    Events:
+        * ``replayEndEvent`` (ib: IBSim): the replay ran out of bars or was stopped.
+    """
+
+    events = IB.events + ('replayEndEvent',)
+
+    def __init__(self, ContractData, AccountBalance=100_000.00, FastForward=True, Profile=False,
+                 AccountUpdateBars=1, AccountUpdateSeconds=0):
         super(IBSim, self).__init__()
-        self.client = SimClient(self.wrapper, ContractData, AccountBalance) 
+        self.replayEndEvent = Event('replayEndEvent')
+        self.client = SimClient(self.wrapper, ContractData, AccountBalance, FastForward,
+                                AccountUpdateBars, AccountUpdateSeconds)
+        if Profile:
+            self.client.profiler.enable()
 
         self.newOrderEvent += self.do_updateOrder
         self.orderModifyEvent += self.do_modifyOrder
         self.cancelOrderEvent += self.do_cancelOrder
+
+    def run(self, *awaitables, timeout=None):
+        """
+        Start the replay and run the event loop until the replay ends, or
+        until ``awaitables`` complete, see :func:`ib_async.util.run`.
+        """
+        self.client.clock.release()
+        if awaitables:
+            return util.run(*awaitables, timeout=timeout)
+        if not self.client.clock.running:
+            # replay already finished, nothing left to run
+            return None
+        if util.getLoop().is_running():
+            # e.g. a notebook: the replay carries on in the running loop
+            return None
+        return util.run(self.runAsync(), timeout=timeout)
+
+    async def runAsync(self):
+        """Start the replay and wait for it to end, leaving the event loop running."""
+        self.client.clock.release()
+        task = self.client._replayTask
+        if task is not None:
+            await task
+
+    def profileReport(self) -> dict:
+        """Phase timings of the replay, see :meth:`Profiler.report`; profile with ``Profile=True``."""
+        return self.client.profiler.report()
+
+    def sleep(self, secs: float = 0.02) -> bool:
+        """Wait for the given amount of simulated seconds while the replay keeps running."""
+        util.run(self.sleepAsync(secs))
+        return True
+
+    def waitUntil(self, t) -> bool:
+        """Wait until the simulated clock reaches time t."""
+        util.run(self.waitUntilAsync(t))
+        return True
+
+    def sleepAsync(self, secs: float = 0.02):
+        self.client.clock.release()
+        return self.client.clock.sleepAsync(secs)
+
+    def waitUntilAsync(self, t):
+        self.client.clock.release()
+        return self.client.clock.waitUntilAsync(t)
      
+    def reqHistoricalData(
+            self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+            formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60,
+            maxBars=0, arrayBars=False) -> BarDataList:
+        """
+        Same as :meth:`IB.reqHistoricalData`; with ``maxBars`` the returned list
+        only keeps the last ``maxBars`` bars, see :class:`BoundedBarDataList`.
+        With ``arrayBars`` it is an :class:`ArrayBarDataList` over the stored
+        bars, for bar sizes equal to the data's.
+        """
+        return self._run(self.reqHistoricalDataAsync(
+            contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+            formatDate, keepUpToDate, chartOptions, timeout, maxBars, arrayBars))
+
+    async def reqHistoricalDataAsync(
+            self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+            formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60,
+            maxBars=0, arrayBars=False) -> BarDataList:
+        reqId = self.client.getReqId()
+        if arrayBars:
+            bars = ArrayBarDataList(maxBars)
+        else:
+            bars = BoundedBarDataList(maxBars) if maxBars else BarDataList()
+        bars.reqId = reqId
+        bars.contract = contract
+        bars.endDateTime = endDateTime
+        bars.durationStr = durationStr
+        bars.barSizeSetting = barSizeSetting
+        bars.whatToShow = whatToShow
+        bars.useRTH = useRTH
+        bars.formatDate = formatDate
+        bars.keepUpToDate = keepUpToDate
+        bars.chartOptions = chartOptions or []
+        future = self.wrapper.startReq(reqId, contract, container=bars)
+        if keepUpToDate:
+            self.wrapper.startSubscription(reqId, bars, contract)
+        end = util.formatIBDatetime(endDateTime)
+        self.client.reqHistoricalData(
+            reqId, contract, end, durationStr, barSizeSetting, whatToShow,
+            useRTH, formatDate, keepUpToDate, chartOptions)
+        task = asyncio.wait_for(future, timeout) if timeout else future
+        try:
+            await task
+        except asyncio.TimeoutError:
+            self.client.cancelHistoricalData(reqId)
+            self._logger.warning(f'reqHistoricalData: Timeout for {contract}')
+            bars.clear()
+        return bars
+
+    def accountValues(self, account: str = ''):
+        """Account values, with the updates pending in the simulated account sent first."""
+        self.client.account.flush()
+        return super().accountValues(account)
+
+    def portfolio(self, account: str = ''):
+        """Portfolio items, with the updates pending in the simulated account sent first."""
+        self.client.account.flush()
+        return super().portfolio(account)
+
+    def snapshot(self, state=None) -> Snapshot:
+        """Simulator state with the strategy's picklable ``state``, see :class:`Snapshot`."""
+        self.client.account.flush()
+        return self.client.snapshot(state)
+
+    def resume(self, snapshot: Snapshot):
+        """
+        Continue from ``snapshot`` on this freshly connected IBSim, built from
+        the same ContractData. Returns the strategy state; attach the handlers
+        to the restored bar lists (``realtimeBars()``) and ``run()``.
+        """
+        return self.client.restore(snapshot)
+
     def do_cancelOrder(self, trade:Trade):
         trade.orderStatus.status = OrderStatus.Cancelled
+        # children held for the cancelled parent go with it
+        for child in self.client.orderBook.remove(trade):
+            self.client.do_orderStatus(child, OrderStatus.Cancelled)
 
     def do_updateOrder(self, trade:Trade):
-        trade.orderStatus.status = OrderStatus.Submitted      
+        orderBook = self.client.orderBook
+        if orderBook.add(trade):
+            trade.orderStatus.status = OrderStatus.PreSubmitted if orderBook.held(trade) else OrderStatus.Submitted
+        else:
+            self._logger.error(f'placeOrder: order type {trade.order.orderType} not supported by the simulator')
+            trade.orderStatus.status = OrderStatus.Inactive
 
     def do_modifyOrder(self, trade:Trade):
-        self._logger.error('orderModifyEvent: Not Implemented')
-        raise NotImplementedError()
\ No newline at end of file
+        if self.client.orderBook.modify(trade):
+            self.client.do_orderStatus(trade, trade.orderStatus.status)
+        else:
+            self._logger.error(f'modifyOrder: order type {trade.order.orderType} not supported by the simulator')
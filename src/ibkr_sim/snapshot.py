@@ -0,0 +1,137 @@
+"""Snapshots of a running simulation: save, resume and fork."""
+
+import asyncio
+import os
+import pickle
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+# wrapper attributes that make up the account, order and subscription state
+WrapperState = (
+    'accountValues', 'acctSummary', 'portfolio', 'positions',
+    'trades', 'permId2Trade', 'fills',
+    'tickers', 'reqId2Ticker', 'ticker2ReqId', 'reqId2Subscriber',
+    'lastTime',
+)
+
+
+@dataclass
+class Snapshot:
+    """
+    Simulator state between two bars, taken with ``IBSim.snapshot``.
+
+    It holds the replay cursors and subscriptions, the wrapper's trades,
+    fills, positions and account values, the order book, the simulated
+    account, the request/permId/execId sequences and the strategy's own
+    ``state``, pickled together at the time of the snapshot so later bars
+    don't change it. Every :meth:`restore` unpickles a fresh copy, so one
+    snapshot can be resumed any number of times. The bar arrays aren't
+    included: resume on an IBSim built from the same ``ContractData``.
+    Event handlers aren't pickled either, the strategy attaches its own
+    again after resuming.
+    """
+
+    time: float
+    bars: int
+    data: bytes
+
+    @classmethod
+    def take(cls, time: float, bars: int, **state) -> 'Snapshot':
+        return cls(time, bars, pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def restore(self) -> dict:
+        """A new copy of the state."""
+        return pickle.loads(self.data)
+
+    def save(self, path: str):
+        """Write the snapshot to ``path``, replacing it atomically so a crash mid-write keeps the previous one."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(self, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'Snapshot':
+        with open(path, 'rb') as fp:
+            return pickle.load(fp)
+
+
+def _child(snapshot: Snapshot, run: Callable[[Snapshot, Any], Any], variant, fd: int):
+    try:
+        # the parent's loop and its selector stay with the parent
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        payload = (True, run(snapshot, variant))
+    except BaseException as e:
+        payload = (False, e)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            try:
+                pickle.dump(payload, fp, pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                pickle.dump((False, RuntimeError(f'result not picklable: {e!r}')), fp)
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(0)
+
+
+def _collect(pid: int, fd: int):
+    with os.fdopen(fd, 'rb') as fp:
+        data = fp.read()
+    os.waitpid(pid, 0)
+    if not data:
+        return False, ChildProcessError(f'child {pid} exited without a result')
+    return pickle.loads(data)
+
+
+def forkRuns(snapshot: Snapshot, run: Callable[[Snapshot, Any], Any], variants: Iterable,
+             workers: Optional[int] = None) -> List[Any]:
+    """
+    ``run(snapshot, variant)`` for every variant, each in a child process
+    forked from this one, at most ``workers`` at a time. Children share
+    the parent's memory copy-on-write, the loaded bars included, and
+    resume the snapshot on a new event loop, typically by building an
+    IBSim with the variant's parameters and calling ``resume``. Call it
+    outside the event loop, e.g. once ``run`` has returned. Returns
+    the results, which must be picklable, in variant order; an exception
+    in a child is raised here once all children finished.
+    """
+    workers = workers or os.cpu_count() or 1
+    variants = list(variants)
+    results: List[Any] = [None] * len(variants)
+    running = []
+    error = None
+
+    def finish():
+        nonlocal error
+        k, pid, fd = running.pop(0)
+        ok, value = _collect(pid, fd)
+        if ok:
+            results[k] = value
+        elif error is None:
+            error = value
+
+    for k, variant in enumerate(variants):
+        if len(running) >= workers:
+            finish()
+        r, w = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            _child(snapshot, run, variant, w)
+        os.close(w)
+        running.append((k, pid, r))
+    while running:
+        finish()
+    if error is not None:
+        raise error
+    return results
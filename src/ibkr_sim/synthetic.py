@@ -0,0 +1,161 @@
+"""Seeded synthetic bars for load tests and benchmarks."""
+
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ib_async.contract import ContractDetails
+
+from ibkr_sim.bar_store import SymbolBars
+from ibkr_sim.sim_clock import Time_t, toTimestamp
+
+DAY = 86400
+
+
+@dataclass
+class _State:
+    index: int
+    logPrice: float
+    regime: int
+
+
+class SyntheticBars:
+    """
+    Deterministic OHLCV series generated with NumPy a chunk of bars at a time.
+
+    Log returns follow a geometric Brownian motion with annualized ``drift``
+    and ``volatility``, or with ``regimes`` given, a Markov chain over
+    (drift, volatility) pairs that leaves the current regime with
+    ``switchProbability`` per bar. Bars fall every ``barSize`` seconds of the
+    daily ``session`` (UTC seconds of day), Monday to Friday unless
+    ``weekends``; the first bar of each session opens with a gap of
+    ``gapVolatility`` standard deviation. Volume follows a U-shaped curve
+    over the session, ``volumeSmile`` times higher at the edges than at
+    midday, with lognormal noise. Prices are rounded to ``minTick``.
+
+    The same parameters and ``seed`` always give the same bars: chunk ``k``
+    draws from its own generator seeded with (``seed``, ``k``). Only the
+    arrays of one chunk are held besides the output, so :meth:`chunks` and
+    :meth:`frames` stream any length in constant memory.
+    """
+
+    def __init__(self, start: Time_t = '2021-01-04', barSize: int = 300, price: float = 4000.0,
+                 drift: float = 0.0, volatility: float = 0.2,
+                 regimes: Optional[Sequence[Tuple[float, float]]] = None, switchProbability: float = 0.001,
+                 session: Tuple[int, int] = (0, DAY), weekends: bool = False, gapVolatility: float = 0.0,
+                 volume: float = 1000.0, volumeSmile: float = 2.0, minTick: float = 0.01,
+                 seed: int = 0, chunkSize: int = 1 << 20):
+        sessionStart, sessionEnd = session
+        if barSize <= 0 or sessionEnd - sessionStart < barSize:
+            raise ValueError(f'Session {session} holds no {barSize} second bar')
+        self.start = int(toTimestamp(start)) // DAY * DAY
+        self.barSize = barSize
+        self.price = price
+        self.regimes = np.asarray(regimes if regimes else [(drift, volatility)], dtype=np.float64)
+        self.switchProbability = switchProbability if len(self.regimes) > 1 else 0.0
+        self.sessionStart = sessionStart
+        self.barsPerSession = (sessionEnd - sessionStart) // barSize
+        self.weekends = weekends
+        self.gapVolatility = gapVolatility
+        self.volume = volume
+        self.volumeSmile = volumeSmile
+        self.minTick = minTick
+        self.seed = seed
+        self.chunkSize = chunkSize
+        daysPerYear = 365 if weekends else 252
+        self.dt = 1.0 / (daysPerYear * self.barsPerSession)
+        # 1970-01-01 was a Thursday, day 0 of the week is Monday
+        self._startDow = (self.start // DAY + 3) % 7
+        if not weekends and self._startDow > 4:
+            self.start += (7 - self._startDow) * DAY
+            self._startDow = 0
+
+    @classmethod
+    def fromContract(cls, contractDetails: ContractDetails, **kwargs) -> 'SyntheticBars':
+        """Bars on the ``minTick`` of a contract, e.g. from ``load_contract``."""
+        kwargs.setdefault('minTick', contractDetails.minTick)
+        return cls(**kwargs)
+
+    def timestamps(self, start: int, stop: int) -> np.ndarray:
+        """Epoch seconds of bars ``start`` to ``stop``."""
+        i = np.arange(start, stop, dtype=np.int64)
+        session, k = np.divmod(i, self.barsPerSession)
+        if self.weekends:
+            day = session
+        else:
+            week, dow = np.divmod(session + self._startDow, 5)
+            day = week * 7 + dow - self._startDow
+        return self.start + day * DAY + self.sessionStart + k * self.barSize
+
+    def _chunk(self, state: _State, n: int) -> SymbolBars:
+        rng = np.random.default_rng((self.seed, state.index // self.chunkSize))
+        start = state.index
+        k = np.arange(start, start + n, dtype=np.int64) % self.barsPerSession
+
+        # regime of every bar: the chain moves at the switch bars, to any other regime
+        regime = np.full(n, state.regime, dtype=np.int64)
+        if self.switchProbability:
+            switches = rng.random(n) < self.switchProbability
+            steps = rng.integers(1, len(self.regimes), switches.sum())
+            path = (state.regime + np.r_[0, np.cumsum(steps)]) % len(self.regimes)
+            regime = path[np.cumsum(switches)]
+        drift, vol = self.regimes[regime, 0], self.regimes[regime, 1]
+
+        # log returns; the open of a session's first bar adds the gap
+        dt = self.dt
+        gaps = np.zeros(n)
+        if self.gapVolatility:
+            opening = k == 0
+            if start == 0:
+                opening[0] = False
+            gaps[opening] = rng.normal(0.0, self.gapVolatility, opening.sum())
+        returns = (drift - 0.5 * vol * vol) * dt + vol * np.sqrt(dt) * rng.standard_normal(n)
+        logClose = state.logPrice + np.cumsum(gaps + returns)
+        logOpen = logClose - returns
+        wick = vol * np.sqrt(dt) * 0.5
+        logHigh = np.maximum(logOpen, logClose) + np.abs(rng.standard_normal(n)) * wick
+        logLow = np.minimum(logOpen, logClose) - np.abs(rng.standard_normal(n)) * wick
+
+        # U-shaped volume over the session
+        x = (k + 0.5) / self.barsPerSession
+        curve = 1.0 + (self.volumeSmile - 1.0) * (2.0 * x - 1.0) ** 2
+        volume = np.maximum(np.rint(self.volume * curve * rng.lognormal(-0.125, 0.5, n)), 1.0)
+
+        tick = self.minTick
+        o, h, l, c = (np.rint(np.exp(a) / tick) * tick for a in (logOpen, logHigh, logLow, logClose))
+        state.index += n
+        state.logPrice = float(logClose[-1])
+        state.regime = int(regime[-1])
+        return SymbolBars(self.timestamps(start, start + n), o, h, l, c, volume)
+
+    def chunks(self, n: int) -> Iterator[SymbolBars]:
+        """The first ``n`` bars as SymbolBars of at most ``chunkSize`` bars."""
+        state = _State(0, float(np.log(self.price)), 0)
+        while state.index < n:
+            yield self._chunk(state, min(self.chunkSize, n - state.index))
+
+    def bars(self, n: int) -> SymbolBars:
+        """The first ``n`` bars, generated into preallocated arrays."""
+        out = SymbolBars(np.empty(n, dtype=np.int64), *(np.empty(n) for _ in range(5)))
+        columns = ('ts', 'open', 'high', 'low', 'close', 'volume')
+        i = 0
+        for chunk in self.chunks(n):
+            j = i + len(chunk)
+            for column in columns:
+                getattr(out, column)[i:j] = getattr(chunk, column)
+            i = j
+        return out
+
+    def frames(self, n: int) -> Iterator[pd.DataFrame]:
+        """The first ``n`` bars as frames with date, open, high, low, close and volume columns."""
+        for chunk in self.chunks(n):
+            yield pd.DataFrame({
+                'date': chunk.ts.astype('datetime64[s]'),
+                'open': chunk.open, 'high': chunk.high, 'low': chunk.low,
+                'close': chunk.close, 'volume': chunk.volume})
+
+    def contractData(self, contractDetails: ContractDetails, n: int) -> dict:
+        """A ``ContractData`` entry for IBSim holding the first ``n`` bars."""
+        return {contractDetails.contract.symbol: {'ContractDetails': contractDetails, 'bars': self.bars(n)}}
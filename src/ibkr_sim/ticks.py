@@ -0,0 +1,111 @@
+"""Synthesized intrabar ticks and sub-bars for the bar replay."""
+
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from ibkr_sim.bar_store import SymbolBars
+
+
+def _vertices(o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Path vertices of each bar: O->L->H->C for bars closing at or above their open, O->H->L->C otherwise."""
+    up = c >= o
+    return np.column_stack((o, np.where(up, l, h), np.where(up, h, l), c))
+
+
+class IntrabarPaths:
+    """
+    Deterministic intrabar path of every bar: O->L->H->C for bars closing at or
+    above their open, O->H->L->C otherwise. The bar volume is split evenly
+    over the ticks, the remainder going to the close. Tick ``k`` is stamped
+    ``k / ticksPerBar`` of the bar length after the bar start.
+
+    Paths are generated with NumPy a chunk of bars at a time and kept as
+    Python lists, so replaying a bar's ticks builds no per-tick arrays.
+    """
+
+    ticksPerBar = 4
+
+    def __init__(self, bars: SymbolBars, chunkSize: int = SymbolBars.chunkSize):
+        self.bars = bars
+        self.chunkSize = chunkSize
+        step = bars.barSize / self.ticksPerBar
+        self.offsets: List[float] = [k * step for k in range(self.ticksPerBar)]
+        self._start = self._stop = 0
+        self._prices: List[List[float]] = []
+        self._sizes: List[List[float]] = []
+
+    def _load(self, i: int):
+        start = i - i % self.chunkSize
+        stop = min(start + self.chunkSize, len(self.bars))
+        b = self.bars
+        o, h, l, c, v = (a[start:stop] for a in (b.open, b.high, b.low, b.close, b.volume))
+        prices = _vertices(o, h, l, c)
+        n = self.ticksPerBar
+        size = np.floor(v / n)
+        sizes = np.repeat(size[:, None], n, axis=1)
+        sizes[:, -1] += v - n * size
+        self._prices = prices.tolist()
+        self._sizes = sizes.tolist()
+        self._start, self._stop = start, stop
+
+    def path(self, i: int) -> Tuple[List[float], List[float]]:
+        """Tick prices and sizes of bar ``i``."""
+        if not self._start <= i < self._stop:
+            self._load(i)
+        k = i - self._start
+        return self._prices[k], self._sizes[k]
+
+
+class SubBars:
+    """
+    Bars of ``seconds`` length (5 by default, the IB real-time bar size)
+    interpolated from each base bar along its IntrabarPaths path: the price
+    moves linearly between the path ticks and holds the close after the
+    last one. Sub-bar volume is the bar volume split evenly and ``wap`` the
+    typical price (H+L+C)/3. A base series already at ``seconds`` (or finer)
+    gives its own bars back.
+
+    Sub-bars are generated with NumPy for a chunk of base bars at a time, as
+    (bars, sub-bars) arrays turned into Python lists.
+    """
+
+    def __init__(self, bars: SymbolBars, seconds: int = 5, chunkSize: int = SymbolBars.chunkSize):
+        self.bars = bars
+        self.seconds = seconds
+        self.count = max(bars.barSize // seconds, 1)
+        self.chunkSize = max(chunkSize // self.count, 1)
+        self.offsets: List[int] = [k * seconds for k in range(self.count)]
+        self._start = self._stop = 0
+        self._columns: Tuple[List[List[float]], ...] = ()
+
+    def _load(self, i: int):
+        start = i - i % self.chunkSize
+        stop = min(start + self.chunkSize, len(self.bars))
+        b = self.bars
+        o, h, l, c, v = (a[start:stop] for a in (b.open, b.high, b.low, b.close, b.volume))
+        n, ticks = self.count, IntrabarPaths.ticksPerBar
+        vertices = _vertices(o, h, l, c)
+        # path position of the sub-bar edges in ticks; past the last tick the close holds
+        x = np.minimum(np.arange(n + 1) * ticks / n, ticks - 1)
+        seg = np.minimum(x.astype(np.int64), ticks - 2)
+        w = x - seg
+        edges = vertices[:, seg] * (1 - w) + vertices[:, seg + 1] * w
+        opens, closes = edges[:, :-1], edges[:, 1:]
+        highs, lows = np.maximum(opens, closes), np.minimum(opens, closes)
+        # the inner vertices are extremes of the sub-bar they fall in
+        for j in range(1, ticks - 1):
+            k = min(j * n // ticks, n - 1)
+            highs[:, k] = np.maximum(highs[:, k], vertices[:, j])
+            lows[:, k] = np.minimum(lows[:, k], vertices[:, j])
+        volumes = np.repeat((v / n)[:, None], n, axis=1)
+        waps = (highs + lows + closes) / 3
+        self._columns = tuple(a.tolist() for a in (opens, highs, lows, closes, volumes, waps))
+        self._start, self._stop = start, stop
+
+    def subBars(self, i: int) -> Iterator[Tuple[int, float, float, float, float, float, float]]:
+        """(offset, open, high, low, close, volume, wap) of the sub-bars of bar ``i``."""
+        if not self._start <= i < self._stop:
+            self._load(i)
+        k = i - self._start
+        return zip(self.offsets, *(column[k] for column in self._columns))
@@ -0,0 +1,157 @@
+"""Round-trip trade journal kept in growable column arrays."""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from eventkit import Event
+
+from ib_async.contract import Contract
+from ib_async.objects import CommissionReport, Fill
+from ib_async.order import Trade
+
+from ibkr_sim.sim_client import apply_fill
+
+Columns = {
+    'ticker': object,
+    'direction': object,
+    'qty': np.float64,
+    'entry_dt': object,
+    'entry_price': np.float64,
+    'exit_dt': object,
+    'exit_price': np.float64,
+    'bars': np.int64,
+    'profit': np.float64,
+}
+
+
+class TradeJournal:
+    """
+    One row per trade, in the ``trade_results`` layout the ``stats`` functions use.
+
+    A row is allocated when a position opens and stays open (``exit_dt`` "",
+    ``exit_price`` 0) until it is closed; the open row of each contract is
+    found through a dict, so a fill costs O(1) whatever the length of the
+    run. Fills are booked with the average-cost rules of ``apply_fill``, the
+    same ones SimClient.do_execution uses:
+
+    * open: new row, charged its commission.
+    * add: quantity and average entry price of the open row are updated.
+    * reduce: the closed part is split off into its own closed row; the
+      remainder keeps the entry time and price.
+    * close / reverse: the row is closed, a reverse opens a new row with
+      the remaining quantity at the fill price.
+
+    Commissions are shared out per contract between closed and opened parts.
+    ``bars`` counts the :meth:`newBar` calls between entry and exit.
+
+    Events:
+        * ``closedEvent`` (row: int): a trade row was closed.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in Columns.items()}
+        self._entryBar = np.empty(capacity, dtype=np.int64)
+        self._rows = 0
+        self._open: Dict[int, int] = {}
+        self._bar = 0
+        self.closedEvent = Event('closedEvent')
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def newBar(self):
+        self._bar += 1
+
+    def openRow(self, conId: int) -> int:
+        """Row of the open trade of the contract, or -1."""
+        return self._open.get(conId, -1)
+
+    def column(self, name: str) -> np.ndarray:
+        """View on the filled part of a column."""
+        return self._arrays[name][:self._rows]
+
+    def _grow(self):
+        capacity = 2 * len(self._entryBar)
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._rows] = array[:self._rows]
+            self._arrays[name] = grown
+        grown = np.empty(capacity, dtype=np.int64)
+        grown[:self._rows] = self._entryBar[:self._rows]
+        self._entryBar = grown
+
+    def _newRow(self, ticker: str, qty: float, price: float, dt: str, entryBar: int, profit: float) -> int:
+        if self._rows == len(self._entryBar):
+            self._grow()
+        row = self._rows
+        self._rows += 1
+        a = self._arrays
+        a['ticker'][row] = ticker
+        a['direction'][row] = 'Long' if qty > 0 else 'Short'
+        a['qty'][row] = qty
+        a['entry_dt'][row] = dt
+        a['entry_price'][row] = price
+        a['exit_dt'][row] = ""
+        a['exit_price'][row] = 0.0
+        a['bars'][row] = 0
+        a['profit'][row] = profit
+        self._entryBar[row] = entryBar
+        return row
+
+    def _close(self, row: int, price: float, dt: str, profit: float):
+        a = self._arrays
+        a['exit_dt'][row] = dt
+        a['exit_price'][row] = price
+        a['bars'][row] = self._bar - self._entryBar[row]
+        a['profit'][row] += profit
+        self.closedEvent.emit(row)
+
+    def fill(self, contract: Contract, qty: float, price: float, dt: str, commission: float):
+        """Book a fill of the signed ``qty`` at ``price``."""
+        conId = contract.conId
+        multiplier = float(contract.multiplier or 1)
+        commPerUnit = commission / abs(qty) if qty else 0.0
+        a = self._arrays
+        row = self._open.get(conId)
+        if row is None:
+            self._open[conId] = self._newRow(contract.symbol, qty, price, dt, self._bar, -commission)
+            return
+
+        position = float(a['qty'][row])
+        newPosition, avgCost, realizedPNL = apply_fill(position, a['entry_price'][row], qty, price, multiplier)
+        if position * qty > 0:
+            # Add to existing position
+            a['qty'][row] = newPosition
+            a['entry_price'][row] = avgCost
+            a['profit'][row] -= commission
+        elif newPosition * position > 0:
+            # Reducing existing position, the closed part becomes its own trade
+            closedQty = -qty
+            closedShare = a['profit'][row] * closedQty / position
+            closedRow = self._newRow(contract.symbol, closedQty, a['entry_price'][row],
+                                     a['entry_dt'][row], self._entryBar[row], closedShare)
+            self._close(closedRow, price, dt, realizedPNL - commission)
+            a['qty'][row] = newPosition
+            a['profit'][row] -= closedShare
+        else:
+            # Close or reverse existing position
+            self._close(row, price, dt, realizedPNL - abs(position) * commPerUnit)
+            del self._open[conId]
+            if newPosition != 0:
+                self._open[conId] = self._newRow(contract.symbol, newPosition, price, dt, self._bar,
+                                                 -abs(newPosition) * commPerUnit)
+
+    def on_commission_report(self, trade: Trade, fill: Fill, report: CommissionReport):
+        """``commissionReportEvent`` handler."""
+        ex = fill.execution
+        side = -1 if ex.side == "SLD" else 1
+        self.fill(fill.contract, side * abs(ex.shares), ex.avgPrice, str(ex.time), report.commission)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        The journal as a DataFrame. Numeric columns are views on the journal
+        arrays, they are not copied; take a copy to keep it past further fills.
+        """
+        n = self._rows
+        return pd.DataFrame({name: array[:n] for name, array in self._arrays.items()}, copy=False)
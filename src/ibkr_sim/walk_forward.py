@@ -0,0 +1,179 @@
+"""Walk-forward optimization of IBSim backtests across a process pool."""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ibkr_sim.bar_store import SymbolBars
+from ibkr_sim.indicator_cache import IndicatorCache
+from ibkr_sim.optimizer import Backtest, Optimizer
+from ibkr_sim.shared_bars import SharedBars, Spec
+from ibkr_sim.sim_clock import durationDelta, durationStart, toDatetime, toTimestamp
+
+# per worker process: (shared bars, indicator cache over them, contract metadata, backtest)
+_worker = None
+
+
+def _initWorker(spec: Spec, meta: dict, backtest: Backtest):
+    global _worker
+    shared = SharedBars.attach(spec)
+    _worker = (shared, IndicatorCache(shared.bars), meta, backtest)
+
+
+def _window(bars: SymbolBars, first: int, end: int) -> SymbolBars:
+    """Views of the bars in [first, end) epoch seconds."""
+    i, j = bars.ts.searchsorted([first, end], side='left').tolist()
+    return SymbolBars(*(getattr(bars, f.name)[i:j] for f in fields(SymbolBars)))
+
+
+def _runWindow(job: tuple) -> dict:
+    first, start, end, params = job
+    shared, indicators, meta, backtest = _worker
+    ContractData = {symbol: {**data, 'bars': _window(shared.bars[symbol], first, end)}
+                    for symbol, data in meta.items()}
+    return backtest(ContractData, start=toDatetime(start), indicators=indicators, **params)
+
+
+@dataclass
+class Fold:
+    """One walk-forward step in epoch seconds: train on [trainStart, testStart), test on [testStart, testEnd)."""
+
+    trainStart: int
+    testStart: int
+    testEnd: int
+
+
+@dataclass
+class WalkForwardResult:
+    """
+    ``folds``: one row per fold with its dates, the chosen parameters, their
+    in-sample objective and the out-of-sample metrics. ``trades``: the
+    closed out-of-sample trades of every fold, in order, with their fold.
+    ``equity``: cumulative out-of-sample profit at each trade exit.
+    """
+
+    folds: pd.DataFrame
+    trades: pd.DataFrame
+    equity: pd.Series
+
+
+class WalkForward(Optimizer):
+    """
+    Rolling in-sample optimization with out-of-sample tests.
+
+    Fold ``k`` trains on ``train`` (an IB ``durationStr``) starting ``k * step``
+    after the first ``warmup`` of data and tests on the ``test`` after it,
+    cut short at the next fold's test so no bar is tested twice; ``step``
+    defaults to ``test`` so the tests tile the data. Every grid point
+    is backtested on every train window and the best by ``objective`` is run
+    on the test window; all folds go through one process pool.
+
+    ``backtest(ContractData, start, indicators, **params)`` runs from
+    ``start`` with the bars before it as warmup (the driver passes the
+    ``warmup`` before each window and nothing past its end) and returns a
+    dict of metrics; a ``'trades'`` entry holding its trade results frame
+    makes up the stitched out-of-sample equity curve. ``indicators`` is the
+    worker's :class:`IndicatorCache`: indicator series taken from it are
+    computed once per parameter set and reused by the overlapping windows
+    of later folds.
+    """
+
+    def __init__(self, ContractData: dict, backtest: Backtest, train: str, test: str, step: Optional[str] = None,
+                 warmup: str = '30 D', objective: str = 'NetProfit', maximize: bool = True,
+                 workers: Optional[int] = None, mp_context=None):
+        super().__init__(ContractData, backtest, workers, mp_context)
+        self.train = train
+        self.test = test
+        self.step = step or test
+        self.warmup = warmup
+        self.objective = objective
+        self.maximize = maximize
+
+    def folds(self) -> List[Fold]:
+        """The train/test windows that fit in the data."""
+        starts = [int(bars.ts[0]) for bars in self._store.values() if len(bars)]
+        ends = [int(bars.ts[-1]) for bars in self._store.values() if len(bars)]
+        if not starts:
+            return []
+        last = max(ends)
+        origin = toDatetime(min(starts)) + durationDelta(self.warmup)
+        train, test, step = (durationDelta(d) for d in (self.train, self.test, self.step))
+        # every date is one offset from the origin, so month ends clamp once and
+        # a fold's test end is the next fold's test start whenever step is test
+        testStarts = []
+        while True:
+            testStart = toTimestamp(origin + (step * len(testStarts) + train))
+            testStarts.append(int(testStart))
+            if testStart > last:
+                break
+        folds = []
+        for k, testStart in enumerate(testStarts[:-1]):
+            testEnd = min(toTimestamp(origin + (step * k + train + test)), testStarts[k + 1], last + 1)
+            folds.append(Fold(int(toTimestamp(origin + step * k)), testStart, int(testEnd)))
+        return folds
+
+    def _job(self, start: int, end: int, params: dict) -> tuple:
+        return int(durationStart(start, self.warmup)), start, end, params
+
+    def _best(self, runs: List[dict]) -> Optional[int]:
+        scores = [run.get(self.objective, math.nan) for run in runs]
+        scores = [-math.inf if s is None or math.isnan(s) else (s if self.maximize else -s) for s in scores]
+        best = int(np.argmax(scores)) if scores else None
+        return best if best is not None and scores[best] > -math.inf else None
+
+    def run(self, params: Dict[str, Iterable]) -> WalkForwardResult:
+        """Optimize ``params`` on every train window and test the winners."""
+        grid = self.grid(params)
+        folds = self.folds()
+        inSample = [self._job(fold.trainStart, fold.testStart, p) for fold in folds for p in grid]
+        if not inSample:
+            return WalkForwardResult(pd.DataFrame(), pd.DataFrame(), pd.Series(dtype=np.float64))
+        workers = min(self.workers, len(inSample))
+        chunksize = max(1, len(inSample) // (workers * 4))
+        with SharedBars.publish(self._store) as shared:
+            with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=self.mp_context,
+                    initializer=_initWorker,
+                    initargs=(shared.spec, self._meta, self.backtest)) as pool:
+                runs = list(pool.map(_runWindow, inSample, chunksize=chunksize))
+                chosen = []
+                for k, fold in enumerate(folds):
+                    foldRuns = runs[k * len(grid):(k + 1) * len(grid)]
+                    best = self._best(foldRuns)
+                    if best is not None:
+                        chosen.append((k, fold, grid[best], foldRuns[best][self.objective]))
+                outOfSample = list(pool.map(_runWindow, [self._job(fold.testStart, fold.testEnd, p)
+                                                         for _, fold, p, _ in chosen]))
+        return self._result(chosen, outOfSample)
+
+    def _result(self, chosen: list, outOfSample: List[dict]) -> WalkForwardResult:
+        for (k, fold, _, _), (j, after, _, _) in zip(chosen, chosen[1:]):
+            if fold.testEnd > after.testStart or (j == k + 1 and self.step == self.test and fold.testEnd != after.testStart):
+                raise RuntimeError(f'out-of-sample windows of folds {k} and {j} do not tile')
+        rows, trades = [], []
+        for (k, fold, params, score), metrics in zip(chosen, outOfSample):
+            metrics = dict(metrics)
+            foldTrades = metrics.pop('trades', None)
+            rows.append({
+                'fold': k,
+                'trainStart': toDatetime(fold.trainStart),
+                'testStart': toDatetime(fold.testStart),
+                'testEnd': toDatetime(fold.testEnd),
+                **params,
+                f'inSample{self.objective}': score,
+                **metrics})
+            if foldTrades is not None and len(foldTrades):
+                closed = foldTrades[foldTrades['exit_dt'] != '']
+                trades.append(closed.assign(fold=k))
+        trades = pd.concat(trades, ignore_index=True) if trades else pd.DataFrame()
+        if trades.empty:
+            equity = pd.Series(dtype=np.float64, name='equity')
+        else:
+            equity = pd.Series(trades['profit'].cumsum().to_numpy(), index=pd.to_datetime(trades['exit_dt']),
+                               name='equity')
+        return WalkForwardResult(pd.DataFrame(rows), trades, equity)